@@ -4,9 +4,25 @@ WMBC Agent - Minimal Continual Learning Agent
 Core loop: Observe → Decide → Act → Observe Outcome → Learn
 """
 
+import asyncio
+import copy
 import json
+import logging
+import mmap
 import os
-from datetime import datetime
+import threading
+import time
+from array import array
+from collections import deque
+from datetime import datetime, timezone
+from enum import IntEnum
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+logger = logging.getLogger(__name__)
 
 # ====== Tool Interfaces (stub for hackathon) ======
 
@@ -14,7 +30,7 @@ def composio_execute(action: dict):
     """
     All real-world actions go through Composio.
     """
-    print(f"[Composio] Executing action: {action}")
+    logger.debug("[Composio] Executing action: %s", action)
     return {"status": "success"}
 
 
@@ -22,72 +38,380 @@ def plivo_speak(message: str):
     """
     Voice output channel.
     """
-    print(f"[Plivo Voice] {message}")
+    logger.debug("[Plivo Voice] %s", message)
 
 
 # ====== Agent Memory ======
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 MEMORY_FILE = os.path.join(BASE_DIR, "memory.json")
+# Events are appended one JSON object per line; memory.json only keeps the
+# small mutable header (belief_state, action_stats, priors).
+MEMORY_EVENTS_FILE = os.path.join(BASE_DIR, "events.jsonl")
+# Pretty-print memory.json only when debugging; compact bytes otherwise.
+MEMORY_DEBUG = os.getenv("AGENT_DEBUG", "false").lower() == "true"
+# Below this size a plain read() is cheaper than setting up a mapping.
+MMAP_MIN_BYTES = 64 * 1024
+# At most this many events created in the current process are kept in
+# memory; the full history stays in MEMORY_EVENTS_FILE.
+MEMORY_EVENTS_CAPACITY = 4096
+
+
+# orjson.JSONDecodeError subclasses json.JSONDecodeError, so callers only
+# need to catch the stdlib exception whichever backend is active.
+if orjson is not None:
+    def _dumps(obj, indent=False):
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0)
+
+    _loads = orjson.loads
+else:
+    # Built once and reused; memory and events are plain trees, so the
+    # circular-reference check is skipped.
+    _ENCODER = json.JSONEncoder(
+        separators=(",", ":"), check_circular=False, ensure_ascii=False
+    )
+    _DEBUG_ENCODER = json.JSONEncoder(indent=2, ensure_ascii=False)
+    _DECODER = json.JSONDecoder()
+
+    def _dumps(obj, indent=False):
+        encoder = _DEBUG_ENCODER if indent else _ENCODER
+        return encoder.encode(obj).encode("utf-8")
+
+    def _loads(data):
+        if not isinstance(data, str):
+            data = bytes(data).decode("utf-8")
+        return _DECODER.decode(data)
+
+
+# Parsed memory files keyed by path -> (st_mtime_ns, st_size, value), so
+# repeated CryFlowAgent() constructions skip re-reading unchanged files.
+_MEM_CACHE = {}
+
+
+def _read_json_file(f):
+    """
+    Parse an open binary file. Large files are mapped and handed to the
+    parser as a buffer to skip the read() copy; returns None when empty.
+    """
+    size = os.fstat(f.fileno()).st_size
+    if size == 0:
+        return None
+    if size < MMAP_MIN_BYTES:
+        return _loads(f.read())
+
+    mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        if orjson is None:
+            return _loads(bytes(mm))
+        view = memoryview(mm)
+        try:
+            return _loads(view)
+        finally:
+            view.release()
+    finally:
+        mm.close()
+
+
+def _stat_key(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def _cached_load(path, loader):
+    key = _stat_key(path)
+    cached = _MEM_CACHE.get(path)
+    if key is not None and cached is not None and cached[:2] == key:
+        return copy.deepcopy(cached[2])
+    value = loader()
+    if key is not None:
+        _MEM_CACHE[path] = (key[0], key[1], value)
+        return copy.deepcopy(value)
+    return value
+
+
+# Formatted whole-second prefixes, reused by every timestamp taken within
+# the same second: (epoch_second, iso_prefix, event_id_prefix). Swapped as
+# one tuple so a reader on another thread never sees a half-updated entry.
+_TS_CACHE = {"entry": None}
+_LAST_TS_MICROS = [0]
+# The shared agent is used from server threads.
+_TS_LOCK = threading.Lock()
+# [epoch_minute, "HH:MM"] in local time for observe().
+_CLOCK_CACHE = [None, ""]
+
+
+def _utc_stamp():
+    """
+    Return (epoch_micros, iso_prefix, id_prefix) for the current UTC time.
+    Micros are strictly increasing within the process so ids never collide.
+    """
+    with _TS_LOCK:
+        micros = time.time_ns() // 1000
+        if micros <= _LAST_TS_MICROS[0]:
+            micros = _LAST_TS_MICROS[0] + 1
+        _LAST_TS_MICROS[0] = micros
+    second = micros // 1_000_000
+    entry = _TS_CACHE["entry"]
+    if entry is None or entry[0] != second:
+        dt = datetime.fromtimestamp(second, timezone.utc)
+        entry = (
+            second,
+            dt.strftime("%Y-%m-%dT%H:%M:%S"),
+            dt.strftime("%Y%m%d_%H%M%S"),
+        )
+        _TS_CACHE["entry"] = entry
+    return micros, entry[1], entry[2]
+
 
 def _iso_now():
-    return datetime.utcnow().isoformat() + "Z"
+    micros, iso_prefix, _ = _utc_stamp()
+    return f"{iso_prefix}.{micros % 1_000_000:06d}Z"
 
 
 def _new_event_id():
-    stamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S_%f")
-    return f"evt_{stamp}"
+    micros, _, id_prefix = _utc_stamp()
+    return f"evt_{id_prefix}_{micros % 1_000_000:06d}"
 
 
-def load_memory():
+def _local_clock():
+    now = time.time()
+    minute = int(now // 60)
+    if minute != _CLOCK_CACHE[0]:
+        _CLOCK_CACHE[0] = minute
+        _CLOCK_CACHE[1] = time.strftime("%H:%M", time.localtime(now))
+    return _CLOCK_CACHE[1]
+
+
+def _empty_header():
+    return {
+        "belief_state": {},
+        "action_stats": {}
+    }
+
+
+def _load_header():
     if not os.path.exists(MEMORY_FILE):
-        return {
-            "events": [],
-            "belief_state": {},
-            "action_stats": {}
-        }
+        return _empty_header()
 
     try:
-        with open(MEMORY_FILE, "r") as f:
-            content = f.read().strip()
-            if not content:
-                return {
-                    "events": [],
-                    "belief_state": {},
-                    "action_stats": {}
-                }
-            data = json.loads(content)
-            data.setdefault("events", [])
+        with open(MEMORY_FILE, "rb") as f:
+            data = _read_json_file(f)
+            if data is None:
+                return _empty_header()
             data.setdefault("belief_state", {})
             data.setdefault("action_stats", {})
             return data
     except json.JSONDecodeError:
-        print("[Agent] Memory corrupted. Reinitializing.")
-        return {
-            "events": [],
-            "belief_state": {},
-            "action_stats": {}
-        }
+        logger.warning("[Agent] Memory corrupted. Reinitializing.")
+        return _empty_header()
+
+
+def iter_events():
+    """
+    Yield events from MEMORY_EVENTS_FILE one line at a time, oldest first,
+    without loading the whole history. For offline analysis; the agent
+    loop itself never reads past events.
+    """
+    if not os.path.exists(MEMORY_EVENTS_FILE):
+        return
+    with open(MEMORY_EVENTS_FILE, "rb") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                yield _loads(line)
+            except json.JSONDecodeError:
+                # A torn last line from an interrupted append; skip it.
+                continue
+
+
+def _append_events(events):
+    if not events:
+        return
+    lines = b"".join(_dumps(event) + b"\n" for event in events)
+    with open(MEMORY_EVENTS_FILE, "ab") as f:
+        f.write(lines)
+
+
+def _append_event(event):
+    _append_events([event])
 
 
+def load_memory():
+    data = _cached_load(MEMORY_FILE, _load_header)
+
+    # Older memory.json files carried the full event history inline.
+    # Move it to the append-only log once so the header stays small.
+    legacy_events = data.pop("events", None)
+    if legacy_events:
+        _append_events(legacy_events)
+        save_memory(data)
+
+    # Only events created by this process are kept in memory; history is
+    # read on demand through iter_events().
+    data["events"] = deque(maxlen=MEMORY_EVENTS_CAPACITY)
+    return data
+
 
 def save_memory(memory):
-    with open(MEMORY_FILE, "w") as f:
-        json.dump(memory, f, indent=2)
+    """
+    Persist the memory header. Events are never rewritten here;
+    they are appended to MEMORY_EVENTS_FILE as they are created.
+    """
+    header = {key: value for key, value in memory.items() if key != "events"}
+    data = _dumps(header, indent=MEMORY_DEBUG)
+    # Write the whole buffer to a sibling file and swap it in, so a crash
+    # mid-write never leaves a truncated memory.json behind.
+    tmp_path = MEMORY_FILE + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, MEMORY_FILE)
+
+    # Refresh the cache with what was just written instead of re-parsing it.
+    key = _stat_key(MEMORY_FILE)
+    if key is not None:
+        _MEM_CACHE[MEMORY_FILE] = (key[0], key[1], copy.deepcopy(header))
 
 
 # ====== Agent Core ======
 
+# Speak the suggestion aloud only above this confidence (percent).
+VOICE_CONFIDENCE_PCT = 75
+
+
+def _speaks_aloud(decision):
+    # Compare in whole percent so the 0.75 threshold is exact.
+    return int(decision["confidence"] * 100 + 0.5) > VOICE_CONFIDENCE_PCT
+
+# learn() rewrites memory.json only after this many updates or this many
+# seconds since the last write; flush() and run_batch() always write.
+HEADER_FLUSH_EVERY = 20
+HEADER_FLUSH_INTERVAL_SEC = 30.0
+
+# Shared, immutable tags for agent-generated events.
+_AGENT_TAGS = ("agent",)
+
+# Cry reason -> action. Reasons not listed (e.g. "unknown") fall back to
+# the need inferred in interpret().
+_REASON_TO_ACTION = {
+    "hunger": "feeding",
+    "emotional_comfort": "comfort",
+    "discomfort": "diaper_check",
+}
+
+
+class Action(IntEnum):
+    """
+    Fixed action vocabulary; values index the action_stats arrays.
+    """
+    feeding = 0
+    comfort = 1
+    diaper_check = 2
+    voice_soothing = 3
+
+
+# Beta(alpha, beta) prior for each action's success probability; a fresh
+# action starts at a 0.6 posterior mean.
+ACTION_PRIOR_ALPHA = 3.0
+ACTION_PRIOR_BETA = 2.0
+
+
+def _unpack_action_stats(raw):
+    """
+    Load action_stats into (alpha, beta) arrays indexed by Action, plus the
+    entries for names outside Action, kept as stored for _pack_action_stats.
+    Accepts the Beta layout as well as older attempts/success counters
+    (packed or {"feeding": {"attempts": n, "success": m}}), which are
+    folded into the prior.
+    """
+    alpha = array("d", [ACTION_PRIOR_ALPHA] * len(Action))
+    beta = array("d", [ACTION_PRIOR_BETA] * len(Action))
+    # "rows": (name, alpha, beta) in the Beta layout; "keys": any other
+    # top-level entries, e.g. legacy {"name": {...}} counters.
+    unknown = {"rows": [], "keys": {}}
+    if not isinstance(raw, dict):
+        return alpha, beta, unknown
+
+    names = raw.get("names")
+    if isinstance(names, list) and "alpha" in raw:
+        for name, a, b in zip(names, raw.get("alpha", []), raw.get("beta", [])):
+            if name in Action.__members__:
+                index = Action[name]
+                alpha[index] = float(a)
+                beta[index] = float(b)
+            else:
+                unknown["rows"].append((name, a, b))
+        unknown["keys"] = {
+            key: value for key, value in raw.items()
+            if key not in ("names", "alpha", "beta")
+        }
+        return alpha, beta, unknown
+
+    if isinstance(names, list):
+        rows = zip(names, raw.get("attempts", []), raw.get("success", []))
+    else:
+        rows = (
+            (name, info.get("attempts", 0), info.get("success", 0))
+            for name, info in raw.items()
+            if isinstance(info, dict)
+        )
+        unknown["keys"] = {
+            key: value for key, value in raw.items()
+            if key not in Action.__members__
+        }
+    for name, tried, won in rows:
+        if name in Action.__members__:
+            index = Action[name]
+            alpha[index] = ACTION_PRIOR_ALPHA + won
+            beta[index] = ACTION_PRIOR_BETA + (tried - won)
+        elif isinstance(names, list):
+            unknown["keys"][name] = {"attempts": tried, "success": won}
+    return alpha, beta, unknown
+
+
+def _pack_action_stats(alpha, beta, unknown=None):
+    packed = {
+        "names": [action.name for action in Action],
+        "alpha": list(alpha),
+        "beta": list(beta),
+    }
+    if unknown:
+        for name, a, b in unknown["rows"]:
+            packed["names"].append(name)
+            packed["alpha"].append(a)
+            packed["beta"].append(b)
+        for key, value in unknown["keys"].items():
+            packed.setdefault(key, value)
+    return packed
+
+
 class CryFlowAgent:
-    def __init__(self):
+    def __init__(self, persist_events: bool = True):
+        # With persist_events=False (dry runs, tests) learn() still updates
+        # action stats but never builds or writes event records.
+        self._persist_events = persist_events
+        self._reload_memory()
+
+    def _reload_memory(self):
         self.memory = load_memory()
+        self._alpha, self._beta, self._unknown_actions = _unpack_action_stats(
+            self.memory.get("action_stats")
+        )
+        self._header_dirty = False
+        self._pending_updates = 0
+        self._last_flush = time.monotonic()
 
     def observe(self, signal: dict) -> dict:
         """
         Observe raw environment signal.
         """
         return {
-            "time": datetime.now().strftime("%H:%M"),
+            "time": _local_clock(),
             "cry_intensity": signal.get("cry_intensity", "high"),
             "last_feed_hours": signal.get("last_feed_hours", 3),
         }
@@ -106,41 +430,33 @@ class CryFlowAgent:
     def decide(self, understanding: dict) -> dict:
     # 1. 从 belief_state 推断哭因
         belief = self.memory.get("belief_state", {}).get("night_cry", {})
+        likely_need = understanding["likely_need"]
 
         if belief:
-            predicted_reason = max(belief, key=belief.get)
-            base_confidence = belief[predicted_reason]
+            predicted_reason, base_confidence = None, -1.0
+            for reason, score in belief.items():
+                if score > base_confidence:
+                    predicted_reason, base_confidence = reason, score
         else:
-            predicted_reason = understanding["likely_need"]
+            predicted_reason = likely_need
             base_confidence = 0.5
 
-    # 2. 原因 → 行为 映射（必须在函数内部）
-        reason_to_action = {
-            "hunger": "feeding",
-            "emotional_comfort": "comfort",
-            "discomfort": "diaper_check",
-            "unknown": understanding["likely_need"]
-        }
-
-        action_type = reason_to_action.get(
-            predicted_reason,
-            understanding["likely_need"]
-        )
+    # 2. 原因 → 行为 映射（未知原因回退到 likely_need）
+        action_type = _REASON_TO_ACTION.get(predicted_reason, likely_need)
 
         # 3. 结合历史 action 成功率
-        stats = self.memory.get("action_stats", {})
-        action_info = stats.get(action_type, {"attempts": 0, "success": 0})
-
-        if action_info["attempts"] > 0:
-            success_rate = action_info["success"] / action_info["attempts"]
-            confidence = round((base_confidence + success_rate) / 2, 2)
-        else:
-            confidence = round(base_confidence, 2)
+        index = Action[action_type]
+        alpha = self._alpha[index]
+        success_rate = alpha / (alpha + self._beta[index])
+        # Mean of the two rates to two places: computed as a fixed-point
+        # percent, rounded half-up with one multiply-add instead of round().
+        confidence = int((base_confidence + success_rate) * 50 + 0.5) / 100
 
         # 4. 打印 agent 的“思考结果”（Demo 关键）
-        print(
-            f"[Agent Belief] Likely cause: {predicted_reason} "
-            f"({int(base_confidence * 100)}%)"
+        logger.debug(
+            "[Agent Belief] Likely cause: %s (%d%%)",
+            predicted_reason,
+            base_confidence * 100,
         )
 
         return {
@@ -158,11 +474,25 @@ class CryFlowAgent:
         """
         composio_execute(decision)
 
-        if decision["confidence"] > 0.75:
+        if _speaks_aloud(decision):
             plivo_speak(
                 f"Suggested action: {decision['action']}. Please try now."
             )
 
+    async def act_async(self, decision: dict):
+        """
+        Same as act(), but Composio and voice output run concurrently.
+        """
+        calls = [asyncio.to_thread(composio_execute, decision)]
+        if _speaks_aloud(decision):
+            calls.append(
+                asyncio.to_thread(
+                    plivo_speak,
+                    f"Suggested action: {decision['action']}. Please try now."
+                )
+            )
+        await asyncio.gather(*calls)
+
     def observe_outcome(self) -> dict:
         """
         Observe outcome (simulated for demo).
@@ -173,19 +503,39 @@ class CryFlowAgent:
         }
 
     def learn(self, understanding, decision, outcome):
-        success = outcome["cry_stopped_minutes"] <= 5
-
-        stats = self.memory.setdefault("action_stats", {})
+        event = self._learn_nowrite(understanding, decision, outcome)
+        if event is not None:
+            _append_event(event)
+        self._pending_updates += 1
+        if (
+            self._pending_updates >= HEADER_FLUSH_EVERY
+            or time.monotonic() - self._last_flush >= HEADER_FLUSH_INTERVAL_SEC
+        ):
+            self._maybe_flush_header()
+
+    def _learn_nowrite(self, understanding, decision, outcome):
+        """
+        Update stats and the in-memory event window without touching disk.
+        Returns the new event so the caller decides when to persist it,
+        or None when events are not being persisted.
+        """
+        success = int(outcome["cry_stopped_minutes"] <= 5)
         action = decision["action"]
-        if action not in stats:
-            stats[action] = {"attempts": 0, "success": 0}
-        stats[action]["attempts"] += 1
-        if success:
-            stats[action]["success"] += 1
+        index = Action[action]
+        alpha, beta = self._alpha, self._beta
+
+        # Conjugate Beta update: one pseudo-count to alpha or beta.
+        alpha[index] += success
+        beta[index] += 1 - success
+        self._header_dirty = True
+        if not self._persist_events:
+            return None
+
+        now = _iso_now()
         event = {
             "id": _new_event_id(),
             "type": "manual",
-            "occurred_at": _iso_now(),
+            "occurred_at": now,
             "source": "agent",
             "category": action,
             "payload": {
@@ -193,11 +543,29 @@ class CryFlowAgent:
                 "confidence": decision["confidence"],
                 "outcome": outcome
             },
-            "tags": ["agent"],
-            "created_at": _iso_now()
+            "tags": _AGENT_TAGS,
+            "created_at": now
         }
-        self.memory.setdefault("events", []).append(event)
+        self.memory["events"].append(event)
+        return event
+
+    def flush(self):
+        """
+        Write any pending header changes. Events are appended as they are
+        created, so this is all a long-running caller needs at shutdown.
+        """
+        self._maybe_flush_header()
+
+    def _maybe_flush_header(self):
+        if not self._header_dirty:
+            return
+        self.memory["action_stats"] = _pack_action_stats(
+            self._alpha, self._beta, self._unknown_actions
+        )
         save_memory(self.memory)
+        self._header_dirty = False
+        self._pending_updates = 0
+        self._last_flush = time.monotonic()
 
 
     def run(self, signal: dict):
@@ -211,11 +579,62 @@ class CryFlowAgent:
         outcome = self.observe_outcome()
         self.learn(understanding, decision, outcome)
 
+    async def run_async(self, signal: dict):
+        """
+        Same as run(), for callers already inside an event loop; tool calls
+        are awaited concurrently.
+        """
+        context = self.observe(signal)
+        understanding = self.interpret(context)
+        decision = self.decide(understanding)
+        await self.act_async(decision)
+        outcome = self.observe_outcome()
+        self.learn(understanding, decision, outcome)
+
+    def run_batch(self, signals):
+        """
+        Run the loop over many signals with a single memory load and a
+        single write: all new events go out in one append, then one
+        header flush.
+        """
+        # Stats learned by earlier run() calls may not be written yet.
+        self._maybe_flush_header()
+        self._reload_memory()
+        events = []
+        for signal in signals:
+            context = self.observe(signal)
+            understanding = self.interpret(context)
+            decision = self.decide(understanding)
+            self.act(decision)
+            outcome = self.observe_outcome()
+            event = self._learn_nowrite(understanding, decision, outcome)
+            if event is not None:
+                events.append(event)
+        _append_events(events)
+        self._maybe_flush_header()
+        return events
+
+
+_AGENT_SINGLETON = None
+
+
+def get_agent():
+    """
+    Shared CryFlowAgent for the process, created on first use so memory is
+    loaded once. Long-running callers should call agent.flush() at shutdown.
+    """
+    global _AGENT_SINGLETON
+    if _AGENT_SINGLETON is None:
+        _AGENT_SINGLETON = CryFlowAgent()
+    return _AGENT_SINGLETON
+
 
 # ====== CLI Entry ======
 
 if __name__ == "__main__":
-    agent = CryFlowAgent()
+    logging.basicConfig(format="%(message)s")
+    logger.setLevel(logging.DEBUG)
+    agent = get_agent()
 
     # Simulated input signal
     input_signal = {
@@ -224,4 +643,5 @@ if __name__ == "__main__":
     }
 
     agent.run(input_signal)
+    agent.flush()
     print("Agent cycle complete.")
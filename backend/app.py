@@ -1,14 +1,30 @@
-import hashlib
+import gzip
+import heapq
 import json
 import os
+import queue
+import re
 import statistics
+import sys
+import threading
 import time
+import zlib
+from array import array
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
-from http.server import BaseHTTPRequestHandler, HTTPServer
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from urllib.parse import urlparse, parse_qs
-from email import message_from_string
-from email.parser import BytesParser
-import io
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 try:
@@ -18,69 +34,185 @@ except Exception:
     pass
 
 MEMORY_FILE = os.path.join(BASE_DIR, "agent", "memory.json")
+AGENT_EVENTS_FILE = os.path.join(BASE_DIR, "agent", "events.jsonl")
 UPLOAD_DIR = os.path.join(BASE_DIR, "uploads")
 MAX_AUDIO_BYTES = 10 * 1024 * 1024
 AB_AUTO_SPLIT = os.getenv("AB_AUTO_SPLIT", "false").lower() == "true"
+# When true, POST /api/events/crying saves the event and responds before
+# reasoning runs; payload.ai_status tells clients to poll GET /api/events/{id}.
+ASYNC_REASONING = os.getenv("ASYNC_REASONING", "false").lower() == "true"
 LIVE_CHUNK_MAX_BYTES = 512 * 1024
+MULTIPART_CHUNK_BYTES = 64 * 1024
+# Below this many samples statistics.median's C sort is already cheaper.
+MEDIAN_NUMPY_MIN = 32
 LIVE_PARTIAL_EVERY_CHUNKS = 3
 LIVE_STREAM_TIMEOUT_SEC = 300
+LIVE_STREAM_SWEEP_SEC = 30
+# Connections are served on threads and kept alive between requests; at
+# most HTTP_MAX_WORKERS crying/live requests (the ones that carry audio and
+# call the model) are handled at once, and idle connections are closed
+# after HTTP_KEEPALIVE_TIMEOUT_SEC. Other routes never wait for a slot.
+HTTP_MAX_WORKERS = int(os.getenv("HTTP_MAX_WORKERS", "8"))
+HTTP_KEEPALIVE_TIMEOUT_SEC = 30
+_REQUEST_SLOTS = threading.BoundedSemaphore(max(1, HTTP_MAX_WORKERS))
+_SLOTTED_POST_PATHS = frozenset((
+    "/api/events/crying",
+    "/api/events/crying/live/start",
+    "/api/events/crying/live/chunk",
+    "/api/events/crying/live/finish",
+))
 LIVE_STREAMS = {}
-
-from audio.analysis import new_audio_id, stub_gemini_result
+# (last_activity, stream_id) for every touch of a live stream; entries
+# superseded by a later touch are skipped when they reach the top.
+_LIVE_EXPIRY_HEAP = []
+_LIVE_EXPIRY_LOCK = threading.Lock()
+# /api/metrics responses and the recent-events snapshot are reused until an
+# event is written or the TTL passes (the TTL covers writers outside this
+# process).
+METRICS_CACHE_TTL_SEC = 5
+RECENT_CACHE_TTL_SEC = 5
+# Cache entries are replaced as whole tuples so threads never see a
+# half-updated entry.
+_METRICS_CACHE = {"entry": None}  # (version, computed_at, body)
+_BELIEF_CACHE = {"entry": None}  # ((st_ino, st_mtime_ns, st_size), belief_state)
+_RECENT_CACHE = {"entry": None}  # (version, fetched_at, events)
+
+from audio.analysis import stub_gemini_result
 from db.sqlite_store import (
-    fetch_events_by_category,
-    fetch_events_since,
+    fetch_feedback_rows,
     fetch_recent_events,
+    fetch_summary_since,
     get_event_by_id,
     init_db,
     insert_event,
     update_event_payload,
+    update_event_streaming,
+    update_event_feedback,
+    events_version,
+    migrate_events_from_log,
     migrate_events_from_memory,
+    sync_feedback_index,
 )
-from engine.learning import load_reasoning_priors, update_reasoning_priors
-from engine.engine import run_reasoning
+from engine.learning import load_reasoning_priors, time_bucket, update_reasoning_priors
+from engine.engine import parse_iso, run_reasoning
+
+
+# orjson emits UTF-8 bytes directly and parses bytes without a decode
+# step; its JSONDecodeError subclasses the stdlib one.
+if orjson is not None:
+    _json_loads = orjson.loads
+
+    def _encode_json(payload):
+        return orjson.dumps(payload)
+else:
+    _json_loads = json.loads
+
+    # Compact separators match orjson's output and skip the padding.
+    def _encode_json(payload):
+        return json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+# Date/time prefixes for the current second, rebuilt only when the second
+# changes; replaced as a whole tuple so threads never see a mixed entry.
+_SECOND_STAMPS = {"entry": None}  # (epoch_sec, iso_prefix, id_prefix)
+# Last microsecond handed out. Stamps are strictly increasing within the
+# process, so two requests in the same microsecond still get distinct ids.
+_LAST_STAMP_MICROS = [0]
+_STAMP_LOCK = threading.Lock()
+
+
+def _clock_stamps():
+    """Read the clock once and return ((sec, iso_prefix, id_prefix), usec)."""
+    with _STAMP_LOCK:
+        micros = time.time_ns() // 1000
+        if micros <= _LAST_STAMP_MICROS[0]:
+            micros = _LAST_STAMP_MICROS[0] + 1
+        _LAST_STAMP_MICROS[0] = micros
+    sec, usec = divmod(micros, 1_000_000)
+    entry = _SECOND_STAMPS["entry"]
+    if entry is None or entry[0] != sec:
+        t = time.gmtime(sec)
+        entry = (
+            sec,
+            f"{t.tm_year:04d}-{t.tm_mon:02d}-{t.tm_mday:02d}T"
+            f"{t.tm_hour:02d}:{t.tm_min:02d}:{t.tm_sec:02d}.",
+            f"evt_{t.tm_year:04d}{t.tm_mon:02d}{t.tm_mday:02d}_"
+            f"{t.tm_hour:02d}{t.tm_min:02d}{t.tm_sec:02d}_",
+        )
+        _SECOND_STAMPS["entry"] = entry
+    return entry, usec
 
 
 def _iso_now():
-    return datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+    # Always emits microseconds so every stamp has the same 27-character
+    # shape.
+    entry, usec = _clock_stamps()
+    return f"{entry[1]}{usec:06d}Z"
+
+
+def _iso_now_and_id():
+    """
+    Read the clock once and return (iso_timestamp, event_id) for a new event.
+    """
+    entry, usec = _clock_stamps()
+    frac = f"{usec:06d}"
+    return f"{entry[1]}{frac}Z", entry[2] + frac
+
+
+# Timestamps recur across requests (recent events, summaries), so parses
+# are cached.
+_parse_iso_str = lru_cache(maxsize=4096)(parse_iso)
 
 
 def _parse_iso(value):
-    if not value:
-        return None
-    try:
-        if value.endswith("Z"):
-            value = value[:-1] + "+00:00"
-        dt = datetime.fromisoformat(value)
-        if dt.tzinfo is None:
-            dt = dt.replace(tzinfo=timezone.utc)
-        return dt
-    except ValueError:
+    if not value or not isinstance(value, str):
         return None
+    return _parse_iso_str(value)
+
+
+def _utc_occurred_at(value, default):
+    """
+    Store occurred_at in the _iso_now() shape, converted to UTC, so range
+    filters and ordering on the column compare real times. Values that do
+    not parse fall back to default, as time checks fall back to created_at.
+    """
+    dt = _parse_iso(value)
+    if dt is None:
+        return default
+    dt = dt.astimezone(timezone.utc)
+    return (
+        f"{dt.year:04d}-{dt.month:02d}-{dt.day:02d}T"
+        f"{dt.hour:02d}:{dt.minute:02d}:{dt.second:02d}.{dt.microsecond:06d}Z"
+    )
 
 
 def _load_belief_state():
-    if not os.path.exists(MEMORY_FILE):
+    """
+    Return belief_state from MEMORY_FILE, re-parsing only when the file's
+    inode, mtime or size changes. The cached dict is shared; callers only
+    serialize it.
+    """
+    try:
+        st = os.stat(MEMORY_FILE)
+    except FileNotFoundError:
         return {}
-    with open(MEMORY_FILE, "r", encoding="utf-8") as f:
-        content = f.read().strip()
-        if not content:
-            return {}
+    key = (st.st_ino, st.st_mtime_ns, st.st_size)
+    entry = _BELIEF_CACHE["entry"]
+    if entry is not None and entry[0] == key:
+        return entry[1]
+
+    belief_state = {}
+    with open(MEMORY_FILE, "rb") as f:
+        content = f.read()
+    if content.strip():
         try:
-            data = json.loads(content)
-        except json.JSONDecodeError:
-            return {}
-        return data.get("belief_state", {})
-
-
-def _new_event_id():
-    stamp = datetime.now(timezone.utc).strftime("%Y%m%d_%H%M%S_%f")
-    return f"evt_{stamp}"
-
-
-def _new_stream_id():
-    stamp = datetime.now(timezone.utc).strftime("%Y%m%d_%H%M%S_%f")
-    return f"str_{stamp}"
+            data = _json_loads(content)
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            data = {}
+        if isinstance(data, dict):
+            belief_state = data.get("belief_state", {})
+    _BELIEF_CACHE["entry"] = (key, belief_state)
+    return belief_state
 
 
 def _mime_extension(mime_type):
@@ -102,16 +234,159 @@ def _safe_json_loads(raw_value, default_value):
     if not isinstance(raw_value, str):
         return default_value
     try:
-        parsed = json.loads(raw_value)
+        parsed = _json_loads(raw_value)
     except json.JSONDecodeError:
         return default_value
     return parsed
 
 
+def _parse_part_headers(raw_headers):
+    field_name = None
+    filename = None
+    content_type = None
+    for line in raw_headers.decode("utf-8", errors="ignore").split("\r\n"):
+        line = line.strip()
+        lowered = line.lower()
+        if lowered.startswith("content-disposition:"):
+            for part in line.split(";"):
+                part = part.strip()
+                if part.startswith("name="):
+                    field_name = part[5:].strip('"')
+                elif part.startswith("filename="):
+                    filename = part[9:].strip('"')
+        elif lowered.startswith("content-type:"):
+            content_type = line.partition(":")[2].strip()
+    return field_name, filename, content_type
+
+
+def _extend_from(target, window, end):
+    # Append window[:end] without materializing the slice; the view must
+    # be released before the caller resizes window.
+    with memoryview(window) as view:
+        target += view[:end]
+
+
+_READ_SCRATCH = threading.local()
+
+
+def _scratch_view():
+    """Per-thread MULTIPART_CHUNK_BYTES buffer that socket reads land in."""
+    view = getattr(_READ_SCRATCH, "view", None)
+    if view is None:
+        view = memoryview(bytearray(MULTIPART_CHUNK_BYTES))
+        _READ_SCRATCH.view = view
+    return view
+
+
+def _read_multipart_stream(stream, length, boundary, max_file_bytes=None):
+    """
+    Parse a multipart body straight off the socket in MULTIPART_CHUNK_BYTES
+    reads, so only the current window and the part contents are held.
+    File parts longer than max_file_bytes keep just max_file_bytes + 1
+    bytes: enough for callers to reject them by length while the rest of
+    the body is drained without buffering.
+    """
+    # Every delimiter after the first is preceded by CRLF; seeding the
+    # window with one lets the first boundary match the same pattern.
+    delimiter = b"\r\n--" + boundary
+    keep = len(delimiter) - 1
+    window = bytearray(b"\r\n")
+    # Reads go into a reused buffer rather than a new bytes per chunk.
+    scratch = _scratch_view()
+    remaining = length
+    parts = {}
+    files = {}
+
+    state = "preamble"
+    field_name = filename = content_type = None
+    content = None
+    limit = None
+
+    while True:
+        if state == "preamble" or state == "body":
+            idx = window.find(delimiter)
+            if idx < 0:
+                flush = len(window) - keep
+                if state == "body" and flush > 0:
+                    if limit is None or len(content) <= limit:
+                        _extend_from(content, window, flush)
+                    del window[:flush]
+                elif state == "preamble" and flush > 0:
+                    del window[:flush]
+            else:
+                if state == "body":
+                    if limit is None or len(content) <= limit:
+                        _extend_from(content, window, idx)
+                    if field_name:
+                        if limit is not None and len(content) > limit + 1:
+                            del content[limit + 1:]
+                        if filename is not None:
+                            files[field_name] = {
+                                "filename": filename,
+                                "content": content,
+                                "content_type": content_type or "application/octet-stream",
+                            }
+                        else:
+                            parts[field_name] = content.decode("utf-8", errors="ignore")
+                del window[:idx + len(delimiter)]
+                state = "delimiter"
+                continue
+        elif state == "delimiter":
+            if len(window) >= 2:
+                if window[:2] == b"--":
+                    break
+                eol = window.find(b"\r\n")
+                if eol >= 0:
+                    # Transport padding after the boundary is ignored.
+                    del window[:eol + 2]
+                    state = "headers"
+                    continue
+        elif state == "headers":
+            idx = window.find(b"\r\n\r\n")
+            if idx >= 0:
+                field_name, filename, content_type = _parse_part_headers(window[:idx])
+                del window[:idx + 4]
+                content = bytearray()
+                limit = max_file_bytes if filename is not None else None
+                state = "body"
+                continue
+
+        if remaining <= 0:
+            break
+        got = stream.readinto(scratch[:min(MULTIPART_CHUNK_BYTES, remaining)])
+        if not got:
+            break
+        remaining -= got
+        window += scratch[:got]
+
+    # Drain anything after the closing delimiter so keep-alive framing
+    # stays intact.
+    while remaining > 0:
+        got = stream.readinto(scratch[:min(MULTIPART_CHUNK_BYTES, remaining)])
+        if not got:
+            break
+        remaining -= got
+
+    return parts, files
+
+
 def _median(values):
     if not values:
         return None
-    return float(statistics.median(values))
+    count = len(values)
+    if np is None or count < MEDIAN_NUMPY_MIN:
+        return float(statistics.median(values))
+    # Linear-time selection instead of a full sort. array('d') input is
+    # viewed without conversion; np.partition works on its own copy.
+    if isinstance(values, array) and values.typecode == "d":
+        arr = np.frombuffer(values, dtype=np.float64)
+    else:
+        arr = np.fromiter(values, dtype=np.float64, count=count)
+    mid = count // 2
+    if count % 2:
+        return float(np.partition(arr, mid)[mid])
+    part = np.partition(arr, (mid - 1, mid))
+    return float((part[mid - 1] + part[mid]) / 2)
 
 
 CRYING_NOTICE = (
@@ -124,80 +399,718 @@ GUIDANCE_UNAVAILABLE_NOTICE = (
 SAFETY_NOTICE = (
     "If high-intensity crying continues or worsens, consider contacting a pediatric professional."
 )
+# Every (include_guidance_unavailable, include_safety) combination, built
+# once; events share the same interned strings.
+_NOTICE_VARIANTS = {
+    (guidance, safety): sys.intern("\n".join(
+        [CRYING_NOTICE]
+        + ([GUIDANCE_UNAVAILABLE_NOTICE] if guidance else [])
+        + ([SAFETY_NOTICE] if safety else [])
+    ))
+    for guidance in (False, True)
+    for safety in (False, True)
+}
 HIGH_INTENSITY_WINDOW_MIN = 60
 HIGH_INTENSITY_THRESHOLD = 3
+# Substring match, like the original keyword list; one scan per text.
+_HIGH_INTENSITY_RE = re.compile("high|intense|piercing|loud|shrill", re.IGNORECASE)
+_METRICS_BUCKETS = ("all", "with_context", "limited_context", "treatment", "control")
 
 
-class APIMockHandler(BaseHTTPRequestHandler):
-    def _event_time(self, event):
-        return _parse_iso(event.get("occurred_at")) or _parse_iso(event.get("created_at"))
+def _event_time(event):
+    return _parse_iso(event.get("occurred_at")) or _parse_iso(event.get("created_at"))
+
+
+def _with_event_times(events):
+    """
+    Pair each event with its parsed time in one pass, so loops that filter
+    and compare timestamps never parse the same event twice. Events whose
+    time cannot be parsed are dropped. The event dicts are left untouched
+    since they are serialized back to clients.
+    """
+    timed = []
+    for event in events:
+        dt = _event_time(event)
+        if dt:
+            timed.append((dt, event))
+    return timed
+
+
+METRICS_PAGE_HTML = """<!doctype html>
+<html lang="en">
+<head>
+  <meta charset="utf-8" />
+  <meta name="viewport" content="width=device-width, initial-scale=1" />
+  <title>WMBC Metrics</title>
+  <style>
+    body { font-family: Arial, sans-serif; margin: 2rem; background: #f7f8fa; color: #111; }
+    .card { max-width: 980px; background: white; border-radius: 12px; padding: 1.2rem; box-shadow: 0 4px 24px rgba(0,0,0,0.08); }
+    table { width: 100%; border-collapse: collapse; margin-bottom: 1rem; }
+    th, td { border: 1px solid #dbe1e8; padding: 0.5rem; text-align: left; }
+    th { background: #f0f4f8; }
+    pre { white-space: pre-wrap; background: #10151c; color: #d8ecff; border-radius: 10px; padding: 1rem; }
+  </style>
+</head>
+<body>
+  <div class="card">
+    <h2>Care Guidance Metrics</h2>
+    <p>Live metrics from <code>/api/metrics</code></p>
+    <table>
+      <thead>
+        <tr><th>Variant</th><th>Samples</th><th>Helpful Rate</th><th>Median Resolved (min)</th></tr>
+      </thead>
+      <tbody id="ab_table">
+        <tr><td colspan="4">Loading...</td></tr>
+      </tbody>
+    </table>
+    <p id="uplift_line"></p>
+    <pre id="output">Loading...</pre>
+  </div>
+  <script>
+    fetch('/api/metrics')
+      .then(function (res) { return res.json(); })
+      .then(function (data) {
+        var metrics = data.metrics || {};
+        var ab = metrics.ab_comparison || {};
+        var treatment = ab.treatment || {};
+        var control = ab.control || {};
+        var abUplift = metrics.ab_uplift || {};
+        var show = function (value) {
+          if (value === null || value === undefined) {
+            return '-';
+          }
+          return String(value);
+        };
+        var rows = [
+          '<tr><td>Treatment</td><td>' + show(treatment.samples) + '</td><td>' + show(treatment.helpful_rate) + '</td><td>' + show(treatment.median_resolved_minutes) + '</td></tr>',
+          '<tr><td>Control</td><td>' + show(control.samples) + '</td><td>' + show(control.helpful_rate) + '</td><td>' + show(control.median_resolved_minutes) + '</td></tr>'
+        ];
+        document.getElementById('ab_table').innerHTML = rows.join('');
+        document.getElementById('uplift_line').textContent =
+          'A/B Uplift: helpful_rate=' + show(abUplift.helpful_rate_uplift) +
+          ', median_resolved_minutes_delta=' + show(abUplift.median_resolved_minutes_delta);
+        document.getElementById('output').textContent = JSON.stringify(data, null, 2);
+      })
+      .catch(function (err) {
+        document.getElementById('output').textContent = 'Error: ' + err;
+      });
+  </script>
+</body>
+</html>"""
+
+ROOT_PAYLOAD = {
+    "ok": True,
+    "service": "wmbc-api-mock",
+    "endpoints": [
+        "POST /api/events/manual",
+        "POST /api/events/crying",
+        "POST /api/events/crying/live/start",
+        "POST /api/events/crying/live/chunk",
+        "POST /api/events/crying/live/finish",
+        "POST /api/events/feedback",
+        "GET /api/events/recent",
+        "GET /api/events/{id}",
+        "GET /api/context/summary",
+        "GET /api/metrics",
+        "GET /docs",
+        "GET /metrics",
+        "GET /health"
+    ]
+}
+
+DOCS_PAYLOAD = {
+    "ok": True,
+    "title": "WhyMyBabyCries API Mock",
+    "base_url": "http://localhost:8000",
+    "endpoints": [
+        {
+            "method": "POST",
+            "path": "/api/events/manual",
+            "body": {
+                "occurred_at": "2026-02-08T09:30:12Z",
+                "category": "feeding|diaper|sleep|comfort",
+                "payload": {"note": "optional"},
+                "tags": ["optional"]
+            }
+        },
+        {
+            "method": "POST",
+            "path": "/api/events/crying",
+            "content_types": ["application/json", "multipart/form-data"],
+            "response_additions": [
+                "payload.ai_meta.model_name",
+                "payload.ai_meta.latency_ms",
+                "payload.ai_meta.request_mode",
+                "payload.notice (may include safety reminder)"
+            ],
+            "body": {
+                "occurred_at": "2026-02-08T10:02:00Z",
+                "ab_variant": "treatment|control (optional, for A/B demo)",
+                "audio_id": "aud_20260208_100200_000000",
+                "audio_url": "s3://.../cry.wav",
+                "payload": {"note": "optional"},
+                "tags": ["optional"]
+            }
+        },
+        {
+            "method": "POST",
+            "path": "/api/events/crying/live/start",
+            "body": {
+                "occurred_at": "2026-02-08T10:02:00Z",
+                "ab_variant": "treatment|control (optional)",
+                "audio_mime_type": "audio/webm",
+                "payload": {"note": "optional"},
+                "tags": ["optional"]
+            },
+            "response": {
+                "stream_id": "str_...",
+                "event_id": "evt_...",
+                "status": "streaming"
+            }
+        },
+        {
+            "method": "POST",
+            "path": "/api/events/crying/live/chunk",
+            "content_types": ["multipart/form-data"],
+            "form_fields": ["stream_id", "chunk(file)", "mime_type(optional)"],
+            "response_notes": [
+                "returns partial_guidance every 3 chunks",
+                "returns stale=true on partial failure without blocking stream"
+            ]
+        },
+        {
+            "method": "POST",
+            "path": "/api/events/crying/live/finish",
+            "body": {
+                "stream_id": "str_..."
+            },
+            "response": {
+                "status": "completed",
+                "event": "final crying event"
+            }
+        },
+        {
+            "method": "POST",
+            "path": "/api/events/feedback",
+            "body": {
+                "event_id": "evt_20260208_100200_000000",
+                "feedback": {
+                    "helpful": True,
+                    "resolved_in_minutes": 5,
+                    "notes": "Feeding worked quickly"
+                }
+            }
+        },
+        {
+            "method": "GET",
+            "path": "/api/events/recent",
+            "query": {
+                "limit": "50",
+                "since": "2026-02-08T00:00:00Z"
+            }
+        },
+        {
+            "method": "GET",
+            "path": "/api/events/{id}"
+        },
+        {
+            "method": "GET",
+            "path": "/api/context/summary"
+        },
+        {
+            "method": "GET",
+            "path": "/api/metrics",
+            "contains": [
+                "metrics.ab_uplift.helpful_rate_uplift",
+                "metrics.ab_uplift.median_resolved_minutes_delta",
+                "metrics.uplift.helpful_rate_uplift",
+                "metrics.uplift.median_resolved_minutes_delta"
+            ]
+        },
+        {
+            "method": "GET",
+            "path": "/metrics"
+        },
+        {
+            "method": "GET",
+            "path": "/health"
+        }
+    ]
+}
+
+
+# Header lines that never change, each block ending the header section.
+_CORS_HEADERS = (
+    b"Access-Control-Allow-Origin: *\r\n"
+    b"Access-Control-Allow-Methods: GET, POST, OPTIONS\r\n"
+    b"Access-Control-Allow-Headers: Content-Type\r\n"
+)
+_JSON_HEADERS = b"Content-Type: application/json; charset=utf-8\r\n" + _CORS_HEADERS + b"\r\n"
+_HTML_HEADERS = (
+    b"Content-Type: text/html; charset=utf-8\r\n"
+    b"Access-Control-Allow-Origin: *\r\n"
+    b"\r\n"
+)
+
+# Static responses are encoded once at import and written as-is.
+_METRICS_PAGE_BODY = METRICS_PAGE_HTML.encode("utf-8")
+# mtime=0 keeps the gzip bytes identical across restarts, like the ETag.
+_METRICS_PAGE_GZIP = gzip.compress(_METRICS_PAGE_BODY, 9, mtime=0)
+# Each encoding is a different representation, so each gets its own tag.
+_METRICS_PAGE_ETAG = f'"{zlib.crc32(_METRICS_PAGE_BODY):08x}"'
+_METRICS_PAGE_GZIP_ETAG = f'"{zlib.crc32(_METRICS_PAGE_BODY):08x}-gzip"'
 
-    def _is_high_intensity(self, event):
-        payload = event.get("payload", {})
+
+def _metrics_page_headers(etag, extra=b"", tail=_HTML_HEADERS):
+    return f"ETag: {etag}\r\nVary: Accept-Encoding\r\n".encode("ascii") + extra + tail
+
+
+_METRICS_PAGE_HEADERS = _metrics_page_headers(_METRICS_PAGE_ETAG)
+_METRICS_PAGE_GZIP_HEADERS = _metrics_page_headers(
+    _METRICS_PAGE_GZIP_ETAG, b"Content-Encoding: gzip\r\n"
+)
+_NOT_MODIFIED_TAIL = b"Access-Control-Allow-Origin: *\r\n\r\n"
+_METRICS_PAGE_NOT_MODIFIED_HEADERS = {
+    _METRICS_PAGE_ETAG: _metrics_page_headers(_METRICS_PAGE_ETAG, tail=_NOT_MODIFIED_TAIL),
+    _METRICS_PAGE_GZIP_ETAG: _metrics_page_headers(
+        _METRICS_PAGE_GZIP_ETAG, tail=_NOT_MODIFIED_TAIL
+    ),
+}
+_ROOT_BODY = _encode_json(ROOT_PAYLOAD)
+_DOCS_BODY = _encode_json(DOCS_PAYLOAD)
+_HEALTH_BODY = _encode_json({"ok": True, "status": "healthy"})
+
+
+def _accepts_gzip(accept_encoding):
+    for coding in (accept_encoding or "").lower().split(","):
+        name, _, params = coding.partition(";")
+        if name.strip() != "gzip":
+            continue
+        # Only an explicit q=0 turns gzip off.
+        _, _, q = params.replace(" ", "").partition("q=")
+        try:
+            return not q or float(q) > 0
+        except ValueError:
+            return True
+    return False
+
+
+def _write_all(fd, data):
+    view = memoryview(data)
+    while view:
+        written = os.write(fd, view)
+        view = view[written:]
+
+
+def _touch_live_stream(stream_id, state):
+    stamp = time.monotonic()
+    state["last_activity"] = stamp
+    with _LIVE_EXPIRY_LOCK:
+        heapq.heappush(_LIVE_EXPIRY_HEAP, (stamp, stream_id))
+
+
+def _close_live_stream(stream_id):
+    """Drop a live stream and close its audio file descriptor."""
+    state = LIVE_STREAMS.pop(stream_id, None)
+    if isinstance(state, dict) and state.get("fd") is not None:
+        os.close(state["fd"])
+        state["fd"] = None
+
+
+def _cleanup_stale_live_streams():
+    cutoff = time.monotonic() - LIVE_STREAM_TIMEOUT_SEC
+    stale = []
+    with _LIVE_EXPIRY_LOCK:
+        while _LIVE_EXPIRY_HEAP and _LIVE_EXPIRY_HEAP[0][0] < cutoff:
+            stale.append(heapq.heappop(_LIVE_EXPIRY_HEAP))
+
+    for stamp, stream_id in stale:
+        state = LIVE_STREAMS.get(stream_id)
+        if not isinstance(state, dict) or state.get("last_activity") != stamp:
+            continue
+        # A request currently working on this stream is not stale;
+        # look at it again on a later cleanup.
+        if not state["lock"].acquire(blocking=False):
+            with _LIVE_EXPIRY_LOCK:
+                heapq.heappush(_LIVE_EXPIRY_HEAP, (stamp, stream_id))
+            continue
+        try:
+            if state.get("last_activity") == stamp:
+                _expire_live_stream(stream_id, state)
+        finally:
+            state["lock"].release()
+
+
+def _expire_live_stream(stream_id, state):
+    if LIVE_STREAMS.get(stream_id) is not state:
+        return
+    event_id = state.get("event_id")
+    event = get_event_by_id(event_id)
+    if event:
+        payload = event.get("payload")
         if not isinstance(payload, dict):
-            return False
-        analysis = payload.get("audio_analysis")
-        if not isinstance(analysis, dict):
-            return False
-        transcription = (analysis.get("transcription") or "").lower()
-        keywords = ("high", "intense", "piercing", "loud", "shrill")
-        return any(keyword in transcription for keyword in keywords)
-
-    def _should_add_safety_notice(self, current_event, recent_events):
-        current_time = self._event_time(current_event)
-        if not current_time:
-            return False
-        window_start = current_time - timedelta(minutes=HIGH_INTENSITY_WINDOW_MIN)
-        high_count = 1 if self._is_high_intensity(current_event) else 0
-        for event in recent_events:
-            if event.get("category") != "crying":
-                continue
-            event_time = self._event_time(event)
-            if not event_time:
-                continue
-            if window_start <= event_time <= current_time and self._is_high_intensity(event):
-                high_count += 1
-        return high_count >= HIGH_INTENSITY_THRESHOLD
-
-    def _compose_notice(self, include_guidance_unavailable=False, include_safety=False):
-        lines = [CRYING_NOTICE]
-        if include_guidance_unavailable:
-            lines.append(GUIDANCE_UNAVAILABLE_NOTICE)
-        if include_safety:
-            lines.append(SAFETY_NOTICE)
-        return "\n".join(lines)
+            payload = {}
+            event["payload"] = payload
+        streaming = payload.get("streaming")
+        if not isinstance(streaming, dict):
+            streaming = {}
+        streaming["status"] = "completed"
+        streaming["ended_at"] = _iso_now()
+        streaming["ended_reason"] = "timeout"
+        payload["streaming"] = streaming
+        payload["notice"] = _compose_notice(include_guidance_unavailable=True)
+        update_event_payload(event_id, payload)
+    _close_live_stream(stream_id)
+    print(f"[LiveStream] Auto-completed stale stream: {stream_id}")
+
+
+def _live_stream_sweeper():
+    # Abandoned streams hold an open fd and their audio mirror, so they are
+    # expired on a timer rather than only when another live request comes.
+    while True:
+        time.sleep(LIVE_STREAM_SWEEP_SEC)
+        try:
+            _cleanup_stale_live_streams()
+        except Exception as exc:
+            print(f"[LiveStream] Cleanup failed: {exc}")
+
+
+_BACKGROUND_REASONING_POOL = ThreadPoolExecutor(
+    max_workers=4, thread_name_prefix="reasoning-bg"
+)
+# ASYNC_REASONING jobs are queued and drained in micro-batches so a burst
+# of crying events shares one recent-context fetch and one priors load.
+REASONING_BATCH_WINDOW_SEC = 0.05
+REASONING_BATCH_MAX = 8
+RECENT_CONTEXT_LIMIT = 20
+_REASONING_QUEUE = queue.Queue()
+_REASONING_WORKER = {"thread": None}
+_REASONING_WORKER_LOCK = threading.Lock()
+
+
+def _enqueue_reasoning(job):
+    with _REASONING_WORKER_LOCK:
+        if _REASONING_WORKER["thread"] is None:
+            worker = threading.Thread(
+                target=_reasoning_batch_worker, name="reasoning-batch", daemon=True
+            )
+            worker.start()
+            _REASONING_WORKER["thread"] = worker
+    _REASONING_QUEUE.put(job)
+
+
+def _recent_events_snapshot():
+    """
+    Return the newest RECENT_CONTEXT_LIMIT + 1 events, re-querying after
+    an event write or once the TTL passes (for writers outside this
+    process). One extra row lets callers drop the current event and still
+    keep RECENT_CONTEXT_LIMIT. The event dicts are shared; callers only
+    read them.
+    """
+    version = events_version()
+    now = time.monotonic()
+    entry = _RECENT_CACHE["entry"]
+    if entry is None or entry[0] != version or now - entry[1] > RECENT_CACHE_TTL_SEC:
+        entry = (version, now, fetch_recent_events(RECENT_CONTEXT_LIMIT + 1))
+        _RECENT_CACHE["entry"] = entry
+    return entry[2]
+
+
+def _next_reasoning_batch():
+    batch = [_REASONING_QUEUE.get()]
+    while len(batch) < REASONING_BATCH_MAX:
+        try:
+            batch.append(_REASONING_QUEUE.get(timeout=REASONING_BATCH_WINDOW_SEC))
+        except queue.Empty:
+            break
+    return batch
+
+
+def _reasoning_batch_worker():
+    while True:
+        batch = _next_reasoning_batch()
+        try:
+            shared_recent = _recent_events_snapshot()
+            # Priors depend only on the day/night bucket of occurred_at.
+            priors_by_bucket = {}
+            for event, audio_bytes, audio_mime_type, assigned_variant in batch:
+                occurred_at = event.get("occurred_at")
+                bucket = time_bucket(occurred_at)
+                if bucket not in priors_by_bucket:
+                    priors_by_bucket[bucket] = load_reasoning_priors(MEMORY_FILE, occurred_at)
+                event_id = event.get("id")
+                recent_events = [e for e in shared_recent if e.get("id") != event_id]
+                _BACKGROUND_REASONING_POOL.submit(
+                    _reason_and_update,
+                    event,
+                    audio_bytes,
+                    audio_mime_type,
+                    assigned_variant,
+                    recent_events=recent_events[:RECENT_CONTEXT_LIMIT],
+                    priors=priors_by_bucket[bucket],
+                )
+        except Exception as exc:
+            print(f"[CareReasoning][Async] Batch of {len(batch)} failed: {exc}")
+
+
+def _run_control_reasoning(event, audio_analysis):
+    """A/B baseline: same analysis, no recent context and no priors."""
+    control_event = {
+        "id": event["id"],
+        "type": event["type"],
+        "occurred_at": event["occurred_at"],
+        "payload": {"audio_analysis": audio_analysis},
+    }
+    return run_reasoning(
+        control_event,
+        [],
+        audio_bytes=None,
+        audio_mime_type=None,
+        learned_priors={},
+    )
+
+
+def _is_high_intensity(event):
+    payload = event.get("payload", {})
+    if not isinstance(payload, dict):
+        return False
+    analysis = payload.get("audio_analysis")
+    if not isinstance(analysis, dict):
+        return False
+    transcription = analysis.get("transcription")
+    if not transcription or not isinstance(transcription, str):
+        return False
+    return _HIGH_INTENSITY_RE.search(transcription) is not None
+
+
+def _should_add_safety_notice(current_event, recent_events):
+    current_time = _event_time(current_event)
+    if not current_time:
+        return False
+    window_start = current_time - timedelta(minutes=HIGH_INTENSITY_WINDOW_MIN)
+    high_count = 1 if _is_high_intensity(current_event) else 0
+    crying_events = [
+        event for event in recent_events if event.get("category") == "crying"
+    ]
+    for event_time, event in _with_event_times(crying_events):
+        if window_start <= event_time <= current_time and _is_high_intensity(event):
+            high_count += 1
+            if high_count >= HIGH_INTENSITY_THRESHOLD:
+                return True
+    return high_count >= HIGH_INTENSITY_THRESHOLD
+
+
+def _compose_notice(include_guidance_unavailable=False, include_safety=False):
+    return _NOTICE_VARIANTS[(bool(include_guidance_unavailable), bool(include_safety))]
+
+
+def _recent_events_excluding(event_id):
+    recent = [e for e in _recent_events_snapshot() if e.get("id") != event_id]
+    return recent[:RECENT_CONTEXT_LIMIT]
+
+
+def _apply_reasoning_to_event(
+    event,
+    audio_bytes,
+    audio_mime_type,
+    assigned_variant,
+    recent_events=None,
+    priors=None,
+):
+    """
+    Run reasoning and update the already-stored event with the result.
+    The event's payload dict is updated in place. Recent events and
+    priors are loaded here unless the caller already has them.
+    """
+    if recent_events is None:
+        recent_events = _recent_events_excluding(event.get("id"))
+    if priors is None:
+        priors = load_reasoning_priors(MEMORY_FILE, event.get("occurred_at"))
+    reasoning_start = time.perf_counter()
+    enrichment, error = run_reasoning(
+        event,
+        recent_events,
+        audio_bytes=audio_bytes,
+        audio_mime_type=audio_mime_type,
+        learned_priors=priors,
+    )
+    reasoning_ms = int((time.perf_counter() - reasoning_start) * 1000)
+    if enrichment and isinstance(enrichment.get("ai_meta"), dict):
+        model_meta = enrichment.get("ai_meta", {})
+        print(
+            "[CareReasoning] total_ms="
+            f"{reasoning_ms} model={model_meta.get('model_name')} "
+            f"latency_ms={model_meta.get('latency_ms')} "
+            f"mode={model_meta.get('request_mode')}"
+        )
+    else:
+        print(f"[CareReasoning] total_ms={reasoning_ms} error={error}")
+    control_enrichment = None
+    control_error = None
+    if enrichment:
+        control_enrichment, control_error = _run_control_reasoning(
+            event, enrichment["audio_analysis"]
+        )
+
+    payload = event.get("payload")
+    if not isinstance(payload, dict):
+        payload = {}
+        event["payload"] = payload
+
+    if enrichment:
+        treatment_guidance = enrichment.get("ai_guidance")
+        treatment_meta = enrichment.get("ai_meta", {})
+        control_guidance = control_enrichment.get("ai_guidance") if isinstance(control_enrichment, dict) else None
+        control_meta = control_enrichment.get("ai_meta", {}) if isinstance(control_enrichment, dict) else {}
+
+        shown_variant = "treatment"
+        shown_guidance = treatment_guidance
+        shown_meta = treatment_meta
+        if assigned_variant == "control" and control_guidance:
+            shown_variant = "control"
+            shown_guidance = control_guidance
+            shown_meta = control_meta
+
+        payload["audio_analysis"] = enrichment["audio_analysis"]
+        payload["ai_guidance"] = shown_guidance
+        payload["ai_meta"] = shown_meta
+        payload["ab_test"] = {
+            "assigned_variant": assigned_variant,
+            "shown_variant": shown_variant,
+            "auto_split_enabled": AB_AUTO_SPLIT,
+            "baseline_mode": "no_context_no_prior",
+            "treatment": {
+                "ai_guidance": treatment_guidance,
+                "ai_meta": treatment_meta,
+            },
+            "control": {
+                "ai_guidance": control_guidance,
+                "ai_meta": control_meta,
+            },
+        }
+        if control_error:
+            payload["ab_test"]["control_error"] = control_error
+
+        add_safety = _should_add_safety_notice(event, recent_events)
+        payload["notice"] = _compose_notice(include_safety=add_safety)
+        if "ai_status" in payload:
+            payload["ai_status"] = "complete"
+        update_event_payload(event["id"], payload)
+        return event, True, None
+
+    payload.pop("ai_guidance", None)
+    ai_meta = error.get("ai_meta", {}) if isinstance(error, dict) else {}
+    payload["ai_meta"] = ai_meta
+    payload["ab_test"] = {
+        "assigned_variant": assigned_variant,
+        "shown_variant": None,
+        "auto_split_enabled": AB_AUTO_SPLIT,
+        "baseline_mode": "no_context_no_prior",
+        "treatment_error": error,
+    }
+    add_safety = _should_add_safety_notice(event, recent_events)
+    payload["notice"] = _compose_notice(
+        include_guidance_unavailable=True,
+        include_safety=add_safety,
+    )
+    if "ai_status" in payload:
+        payload["ai_status"] = "unavailable"
+    update_event_payload(event["id"], payload)
+    print(f"[CareReasoning][BestEffort] Guidance unavailable: {error}")
+    return event, False, error
+
+
+def _reason_and_update(
+    event,
+    audio_bytes,
+    audio_mime_type,
+    assigned_variant,
+    recent_events=None,
+    priors=None,
+):
+    """Background half of an ASYNC_REASONING crying POST."""
+    try:
+        _apply_reasoning_to_event(
+            event,
+            audio_bytes=audio_bytes,
+            audio_mime_type=audio_mime_type,
+            assigned_variant=assigned_variant,
+            recent_events=recent_events,
+            priors=priors,
+        )
+    except Exception as exc:
+        print(f"[CareReasoning][Async] Failed for {event.get('id')}: {exc}")
+        event["payload"]["ai_status"] = "unavailable"
+        update_event_payload(event["id"], event["payload"])
+
+
+class APIMockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    timeout = HTTP_KEEPALIVE_TIMEOUT_SEC
+    # Buffer wfile so responses built from several writes (send_error's
+    # headers + body) go out in one send when handle_one_request flushes.
+    wbufsize = -1
 
     def _resolve_ab_variant(self, requested_variant, event_id):
         if requested_variant in ("treatment", "control"):
             return requested_variant
         if AB_AUTO_SPLIT:
-            digest = hashlib.md5(event_id.encode("utf-8")).hexdigest()
-            bucket = int(digest[:2], 16) % 2
+            # Stable across restarts (unlike hash()); only the low bit is used.
+            bucket = zlib.crc32(event_id.encode("ascii")) & 1
             return "control" if bucket == 1 else "treatment"
         return "treatment"
 
     def _send_json(self, status, payload):
-        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
-        self.send_response(status)
-        self.send_header("Content-Type", "application/json; charset=utf-8")
-        self.send_header("Content-Length", str(len(body)))
-        self.send_header("Access-Control-Allow-Origin", "*")
-        self.send_header("Access-Control-Allow-Methods", "GET, POST, OPTIONS")
-        self.send_header("Access-Control-Allow-Headers", "Content-Type")
-        self.end_headers()
-        self.wfile.write(body)
+        self._send_json_body(status, _encode_json(payload))
+
+    def _send_json_body(self, status, body):
+        self._send_body(status, _JSON_HEADERS, body)
+
+    def _send_body(self, status, static_headers, body):
+        """
+        Write status line, headers and body in one wfile.write. Only the
+        status line, Date and Content-Length are formatted per response.
+        """
+        self.log_request(status)
+        head = (
+            f"{self.protocol_version} {status} {self.responses[status][0]}\r\n"
+            f"Server: {self.version_string()}\r\n"
+            f"Date: {self.date_time_string()}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+        ).encode("latin-1")
+        if getattr(self, "_body_pending", False):
+            head += b"Connection: close\r\n"
+            self.close_connection = True
+        self.wfile.write(head + static_headers + body)
+
+    def _send_without_body(self, status, static_headers):
+        """
+        Like _send_body for 204/304 responses, which carry no
+        Content-Length.
+        """
+        self.log_request(status)
+        head = (
+            f"{self.protocol_version} {status} {self.responses[status][0]}\r\n"
+            f"Server: {self.version_string()}\r\n"
+            f"Date: {self.date_time_string()}\r\n"
+        ).encode("latin-1")
+        if getattr(self, "_body_pending", False):
+            head += b"Connection: close\r\n"
+            self.close_connection = True
+        self.wfile.write(head + static_headers)
 
     def _read_json(self):
         length = int(self.headers.get("Content-Length", "0"))
         if length <= 0:
             return {}
-        raw = self.rfile.read(length).decode("utf-8")
+        raw = self.rfile.read(length)
+        self._body_pending = False
         try:
-            return json.loads(raw)
-        except json.JSONDecodeError:
+            return _json_loads(raw)
+        except (json.JSONDecodeError, UnicodeDecodeError):
             return None
 
-    def _parse_multipart(self, label="multipart"):
+    def _parse_multipart(self, label="multipart", max_file_bytes=None):
         """Parse multipart/form-data without using deprecated cgi module"""
         start = time.perf_counter()
         content_type = self.headers.get("Content-Type", "")
@@ -215,62 +1128,14 @@ class APIMockHandler(BaseHTTPRequestHandler):
         if not boundary:
             return {}
 
-        # Read raw body
         length = int(self.headers.get("Content-Length", "0"))
         if length <= 0:
             return {}
 
-        body = self.rfile.read(length)
-
-        # Parse parts
-        parts = {}
-        files = {}
-        boundary_bytes = ("--" + boundary).encode()
-
-        sections = body.split(boundary_bytes)
-        for section in sections[1:-1]:  # Skip first empty and last closing
-            if not section or section == b"--\r\n" or section == b"--":
-                continue
-
-            # Split headers and content
-            if b"\r\n\r\n" in section:
-                header_section, content = section.split(b"\r\n\r\n", 1)
-            else:
-                continue
-
-            # Remove trailing CRLF from content
-            content = content.rstrip(b"\r\n")
-
-            # Parse headers
-            headers_text = header_section.decode("utf-8", errors="ignore")
-            field_name = None
-            filename = None
-            content_type_field = None
-
-            for line in headers_text.split("\r\n"):
-                line = line.strip()
-                if line.lower().startswith("content-disposition:"):
-                    # Extract name and filename
-                    for part in line.split(";"):
-                        part = part.strip()
-                        if part.startswith("name="):
-                            field_name = part[5:].strip('"')
-                        elif part.startswith("filename="):
-                            filename = part[9:].strip('"')
-                elif line.lower().startswith("content-type:"):
-                    content_type_field = line.split(":", 1)[1].strip()
-
-            if field_name:
-                if filename:
-                    # File field
-                    files[field_name] = {
-                        "filename": filename,
-                        "content": content,
-                        "content_type": content_type_field or "application/octet-stream"
-                    }
-                else:
-                    # Regular field
-                    parts[field_name] = content.decode("utf-8", errors="ignore")
+        parts, files = _read_multipart_stream(
+            self.rfile, length, boundary.encode(), max_file_bytes
+        )
+        self._body_pending = False
 
         elapsed_ms = int((time.perf_counter() - start) * 1000)
         print(
@@ -279,13 +1144,13 @@ class APIMockHandler(BaseHTTPRequestHandler):
         return {"parts": parts, "files": files}
 
     def _read_multipart_form(self):
-        parsed = self._parse_multipart(label="crying")
+        parsed = self._parse_multipart(label="crying", max_file_bytes=MAX_AUDIO_BYTES)
         parts = parsed.get("parts", {})
         files = parsed.get("files", {})
 
         body = {
             "occurred_at": parts.get("occurred_at"),
-            "source": parts.get("source"),
+            "source": parts.get("source") or "device",
             "audio_id": parts.get("audio_id"),
             "audio_url": parts.get("audio_url"),
             "ab_variant": parts.get("ab_variant"),
@@ -325,7 +1190,7 @@ class APIMockHandler(BaseHTTPRequestHandler):
         return self._read_json()
 
     def _read_live_chunk_form(self):
-        parsed = self._parse_multipart(label="live_chunk")
+        parsed = self._parse_multipart(label="live_chunk", max_file_bytes=LIVE_CHUNK_MAX_BYTES)
         parts = parsed.get("parts", {})
         files = parsed.get("files", {})
 
@@ -346,220 +1211,73 @@ class APIMockHandler(BaseHTTPRequestHandler):
             }
         return payload
 
-    def _cleanup_stale_live_streams(self):
-        now = datetime.now(timezone.utc)
-        stale_stream_ids = []
-        for stream_id, state in LIVE_STREAMS.items():
-            last_seen = state.get("last_activity")
-            if not isinstance(last_seen, datetime):
-                continue
-            if (now - last_seen).total_seconds() > LIVE_STREAM_TIMEOUT_SEC:
-                stale_stream_ids.append(stream_id)
-
-        for stream_id in stale_stream_ids:
-            state = LIVE_STREAMS.get(stream_id)
-            if not isinstance(state, dict):
-                continue
-            event_id = state.get("event_id")
-            event = get_event_by_id(event_id)
-            if event:
-                payload = dict(event.get("payload", {}))
-                streaming = payload.get("streaming")
-                if not isinstance(streaming, dict):
-                    streaming = {}
-                streaming["status"] = "completed"
-                streaming["ended_at"] = _iso_now()
-                streaming["ended_reason"] = "timeout"
-                payload["streaming"] = streaming
-                payload["notice"] = self._compose_notice(include_guidance_unavailable=True)
-                update_event_payload(event_id, payload)
-            LIVE_STREAMS.pop(stream_id, None)
-            print(f"[LiveStream] Auto-completed stale stream: {stream_id}")
-
-    def _recent_events_excluding(self, event_id):
-        return [
-            item for item in fetch_recent_events(20, None)
-            if item.get("id") != event_id
-        ]
-
-    def _apply_reasoning_to_event(self, event, audio_bytes, audio_mime_type, assigned_variant):
-        recent_events = self._recent_events_excluding(event.get("id"))
-        priors = load_reasoning_priors(MEMORY_FILE, event.get("occurred_at"))
-        reasoning_start = time.perf_counter()
-        enrichment, error = run_reasoning(
-            event,
-            recent_events,
-            audio_bytes=audio_bytes,
-            audio_mime_type=audio_mime_type,
-            learned_priors=priors,
-        )
-        reasoning_ms = int((time.perf_counter() - reasoning_start) * 1000)
-        if enrichment and isinstance(enrichment.get("ai_meta"), dict):
-            model_meta = enrichment.get("ai_meta", {})
-            print(
-                "[CareReasoning] total_ms="
-                f"{reasoning_ms} model={model_meta.get('model_name')} "
-                f"latency_ms={model_meta.get('latency_ms')} "
-                f"mode={model_meta.get('request_mode')}"
-            )
-        else:
-            print(f"[CareReasoning] total_ms={reasoning_ms} error={error}")
-        control_enrichment = None
-        control_error = None
-        if enrichment:
-            control_event = {
-                "id": event["id"],
-                "type": event["type"],
-                "occurred_at": event["occurred_at"],
-                "payload": {"audio_analysis": enrichment["audio_analysis"]},
-            }
-            control_enrichment, control_error = run_reasoning(
-                control_event,
-                [],
-                audio_bytes=None,
-                audio_mime_type=None,
-                learned_priors={},
-            )
-
-        if enrichment:
-            payload = dict(event.get("payload", {}))
-            treatment_guidance = enrichment.get("ai_guidance")
-            treatment_meta = enrichment.get("ai_meta", {})
-            control_guidance = control_enrichment.get("ai_guidance") if isinstance(control_enrichment, dict) else None
-            control_meta = control_enrichment.get("ai_meta", {}) if isinstance(control_enrichment, dict) else {}
-
-            shown_variant = "treatment"
-            shown_guidance = treatment_guidance
-            shown_meta = treatment_meta
-            if assigned_variant == "control" and control_guidance:
-                shown_variant = "control"
-                shown_guidance = control_guidance
-                shown_meta = control_meta
-
-            payload["audio_analysis"] = enrichment["audio_analysis"]
-            payload["ai"] = enrichment["audio_analysis"]
-            payload["ai_guidance"] = shown_guidance
-            payload["ai_meta"] = shown_meta
-            payload["ab_test"] = {
-                "assigned_variant": assigned_variant,
-                "shown_variant": shown_variant,
-                "auto_split_enabled": AB_AUTO_SPLIT,
-                "baseline_mode": "no_context_no_prior",
-                "treatment": {
-                    "ai_guidance": treatment_guidance,
-                    "ai_meta": treatment_meta,
-                },
-                "control": {
-                    "ai_guidance": control_guidance,
-                    "ai_meta": control_meta,
-                },
-            }
-            if control_error:
-                payload["ab_test"]["control_error"] = control_error
-
-            event["payload"] = payload
-            add_safety = self._should_add_safety_notice(event, recent_events)
-            payload["notice"] = self._compose_notice(include_safety=add_safety)
-            update_event_payload(event["id"], payload)
-            event["payload"] = payload
-            return event, True, None
-
-        payload = dict(event.get("payload", {}))
-        payload.pop("ai_guidance", None)
-        ai_meta = error.get("ai_meta", {}) if isinstance(error, dict) else {}
-        payload["ai_meta"] = ai_meta
-        payload["ab_test"] = {
-            "assigned_variant": assigned_variant,
-            "shown_variant": None,
-            "auto_split_enabled": AB_AUTO_SPLIT,
-            "baseline_mode": "no_context_no_prior",
-            "treatment_error": error,
-        }
-        event["payload"] = payload
-        add_safety = self._should_add_safety_notice(event, recent_events)
-        payload["notice"] = self._compose_notice(
-            include_guidance_unavailable=True,
-            include_safety=add_safety,
-        )
-        update_event_payload(event["id"], payload)
-        event["payload"] = payload
-        print(f"[CareReasoning][BestEffort] Guidance unavailable: {error}")
-        return event, False, error
-
     def do_OPTIONS(self):
-        self.send_response(204)
-        self.send_header("Access-Control-Allow-Origin", "*")
-        self.send_header("Access-Control-Allow-Methods", "GET, POST, OPTIONS")
-        self.send_header("Access-Control-Allow-Headers", "Content-Type")
-        self.end_headers()
+        self._send_without_body(204, _CORS_HEADERS + b"\r\n")
+
+    def _split_path(self):
+        raw = self.path
+        # Most requests carry no query string; skip urlparse for those.
+        if raw.startswith("/") and "?" not in raw and "#" not in raw:
+            return raw, ""
+        parsed = urlparse(raw)
+        return parsed.path, parsed.query
 
     def do_POST(self):
-        parsed = urlparse(self.path)
-        if parsed.path == "/api/events/manual":
-            self._handle_post_manual()
-            return
-        if parsed.path == "/api/events/crying/live/start":
-            self._handle_live_start()
-            return
-        if parsed.path == "/api/events/crying/live/chunk":
-            self._handle_live_chunk()
-            return
-        if parsed.path == "/api/events/crying/live/finish":
-            self._handle_live_finish()
-            return
-        if parsed.path == "/api/events/crying":
-            self._handle_post_crying()
-            return
-        if parsed.path == "/api/events/feedback":
-            self._handle_post_feedback()
+        # A body left unread would be parsed as the next request on this
+        # connection; _send_body closes the connection in that case.
+        self._body_pending = (
+            int(self.headers.get("Content-Length", "0") or 0) > 0
+            or "Transfer-Encoding" in self.headers
+        )
+        path, _ = self._split_path()
+        handler = self._POST_ROUTES.get(path)
+        if handler is not None:
+            if path in _SLOTTED_POST_PATHS:
+                with _REQUEST_SLOTS:
+                    handler(self)
+            else:
+                handler(self)
             return
         self._send_json(404, {"ok": False, "error": "Not found"})
 
     def do_GET(self):
-        parsed = urlparse(self.path)
-        if parsed.path == "/":
-            self._handle_root()
-            return
-        if parsed.path == "/docs":
-            self._handle_docs()
-            return
-        if parsed.path == "/metrics":
-            self._handle_metrics_page()
-            return
-        if parsed.path == "/health":
-            self._send_json(200, {"ok": True, "status": "healthy"})
+        self._body_pending = False
+        path, query = self._split_path()
+        handler = self._GET_ROUTES.get(path)
+        if handler is not None:
+            handler(self)
             return
-        if parsed.path == "/api/events/recent":
-            self._handle_get_recent(parsed.query)
+        if path == "/api/events/recent":
+            self._handle_get_recent(query)
             return
-        if parsed.path == "/api/metrics":
-            self._handle_get_metrics()
-            return
-        if parsed.path.startswith("/api/events/"):
-            self._handle_get_event_by_id(parsed.path)
-            return
-        if parsed.path == "/api/context/summary":
-            self._handle_get_summary()
+        if path.startswith("/api/events/"):
+            self._handle_get_event_by_id(path)
             return
         self._send_json(404, {"ok": False, "error": "Not found"})
 
+    def _handle_health(self):
+        self._send_json_body(200, _HEALTH_BODY)
+
     def _handle_post_manual(self):
         body = self._read_json()
         if body is None:
             self._send_json(400, {"ok": False, "error": "Invalid JSON"})
             return
 
+        now, event_id = _iso_now_and_id()
         event = {
-            "id": _new_event_id(),
+            "id": event_id,
             "type": "manual",
-            "occurred_at": body.get("occurred_at") or _iso_now(),
+            "occurred_at": _utc_occurred_at(body.get("occurred_at"), now),
             "source": body.get("source", "parent"),
             "category": body.get("category", "unknown"),
             "payload": body.get("payload", {}),
             "tags": body.get("tags", []),
-            "created_at": _iso_now(),
+            "created_at": now,
         }
-        insert_event(event)
+        if not insert_event(event):
+            self._send_json(409, {"ok": False, "error": "Event id already exists"})
+            return
         self._send_json(200, {"ok": True, "event": event})
 
     def _handle_post_crying(self):
@@ -581,14 +1299,16 @@ class APIMockHandler(BaseHTTPRequestHandler):
         if isinstance(audio_upload, dict):
             raw_audio = audio_upload.get("bytes")
             if isinstance(raw_audio, (bytes, bytearray)):
-                audio_bytes = bytes(raw_audio)
+                audio_bytes = raw_audio
             if audio_bytes and len(audio_bytes) > MAX_AUDIO_BYTES:
                 self._send_json(413, {"ok": False, "error": "Audio file too large"})
                 return
             audio_mime_type = audio_upload.get("mime_type") or "application/octet-stream"
 
         payload.pop("ai_guidance", None)
-        payload["audio_id"] = body.get("audio_id") or payload.get("audio_id") or new_audio_id()
+        now, event_id = _iso_now_and_id()
+        # Same shape as new_audio_id(), without a second clock read.
+        payload["audio_id"] = body.get("audio_id") or payload.get("audio_id") or "aud_" + event_id[4:]
         if audio_bytes:
             original_name = ""
             if isinstance(audio_upload, dict):
@@ -601,36 +1321,59 @@ class APIMockHandler(BaseHTTPRequestHandler):
             payload["audio_mime_type"] = audio_mime_type
 
         payload["audio_url"] = body.get("audio_url") or payload.get("audio_url")
-        payload["notice"] = self._compose_notice()
+        payload["notice"] = _compose_notice()
+        # "ai" is the legacy input name for audio_analysis; only the
+        # canonical key is stored.
+        legacy_analysis = payload.pop("ai", None)
         if "audio_analysis" not in payload:
-            payload["audio_analysis"] = payload.get("ai") or stub_gemini_result()
-        if "ai" not in payload:
-            payload["ai"] = payload["audio_analysis"]
+            payload["audio_analysis"] = legacy_analysis or stub_gemini_result()
 
         event = {
-            "id": _new_event_id(),
+            "id": event_id,
             "type": "crying",
-            "occurred_at": body.get("occurred_at") or _iso_now(),
+            "occurred_at": _utc_occurred_at(body.get("occurred_at"), now),
             "source": body.get("source", "device"),
             "category": "crying",
             "payload": payload,
             "tags": tags,
-            "created_at": _iso_now(),
+            "created_at": now,
         }
-        insert_event(event)
 
         assigned_variant = self._resolve_ab_variant(body.get("ab_variant"), event["id"])
-        event, _, _ = self._apply_reasoning_to_event(
-            event,
-            audio_bytes=audio_bytes,
-            audio_mime_type=audio_mime_type,
-            assigned_variant=assigned_variant,
-        )
+        if ASYNC_REASONING:
+            payload["ai_status"] = "pending"
+            if not insert_event(event):
+                self._send_json(409, {"ok": False, "error": "Event id already exists"})
+                return
+            # Encode before submitting: the job fills in this payload dict.
+            body = _encode_json({"ok": True, "event": event})
+            _enqueue_reasoning(
+                (event, audio_bytes, audio_mime_type, assigned_variant)
+            )
+            self._send_json_body(200, body)
+            return
+
+        # Stored before reasoning so the event is visible, and kept, while
+        # the model call runs.
+        if not insert_event(event):
+            self._send_json(409, {"ok": False, "error": "Event id already exists"})
+            return
+        try:
+            _apply_reasoning_to_event(
+                event,
+                audio_bytes=audio_bytes,
+                audio_mime_type=audio_mime_type,
+                assigned_variant=assigned_variant,
+            )
+        except Exception as exc:
+            print(f"[CareReasoning] Failed for {event['id']}: {exc}")
+            payload["notice"] = _compose_notice(include_guidance_unavailable=True)
+            update_event_payload(event["id"], payload)
 
         self._send_json(200, {"ok": True, "event": event})
 
     def _handle_live_start(self):
-        self._cleanup_stale_live_streams()
+        _cleanup_stale_live_streams()
         body = self._read_json()
         if body is None:
             self._send_json(400, {"ok": False, "error": "Invalid JSON"})
@@ -643,9 +1386,9 @@ class APIMockHandler(BaseHTTPRequestHandler):
         if not isinstance(tags, list):
             tags = []
 
-        stream_id = _new_stream_id()
-        event_id = _new_event_id()
-        audio_id = body.get("audio_id") or payload.get("audio_id") or new_audio_id()
+        now, event_id = _iso_now_and_id()
+        stream_id = "str_" + event_id[4:]
+        audio_id = body.get("audio_id") or payload.get("audio_id") or "aud_" + event_id[4:]
         mime_type = body.get("audio_mime_type") or "audio/webm"
         extension = _mime_extension(mime_type)
         live_file_path = os.path.join(UPLOAD_DIR, "live", f"{stream_id}{extension}")
@@ -654,7 +1397,7 @@ class APIMockHandler(BaseHTTPRequestHandler):
         streaming = {
             "stream_id": stream_id,
             "status": "streaming",
-            "started_at": _iso_now(),
+            "started_at": now,
             "last_chunk_at": None,
             "chunks_received": 0,
             "partial_every_chunks": LIVE_PARTIAL_EVERY_CHUNKS,
@@ -666,30 +1409,38 @@ class APIMockHandler(BaseHTTPRequestHandler):
         payload["audio_id"] = audio_id
         payload["audio_mime_type"] = mime_type
         payload["audio_path"] = os.path.relpath(live_file_path, BASE_DIR).replace("\\", "/")
-        payload["notice"] = self._compose_notice()
+        payload["notice"] = _compose_notice()
         payload["streaming"] = streaming
 
         event = {
             "id": event_id,
             "type": "crying",
-            "occurred_at": body.get("occurred_at") or _iso_now(),
+            "occurred_at": _utc_occurred_at(body.get("occurred_at"), now),
             "source": body.get("source", "device"),
             "category": "crying",
             "payload": payload,
             "tags": tags,
-            "created_at": _iso_now(),
+            "created_at": now,
         }
-        insert_event(event)
+        if not insert_event(event):
+            self._send_json(409, {"ok": False, "error": "Event id already exists"})
+            return
 
+        # The file stays open for the life of the stream and chunks are
+        # mirrored in memory, so partial and final reasoning never re-read
+        # it from disk.
         LIVE_STREAMS[stream_id] = {
             "event_id": event_id,
             "file_path": live_file_path,
+            "fd": os.open(live_file_path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644),
+            "audio": bytearray(),
             "audio_mime_type": mime_type,
             "chunk_count": 0,
             "total_bytes": 0,
-            "last_activity": datetime.now(timezone.utc),
             "assigned_variant": assigned_variant,
+            "lock": threading.Lock(),
         }
+        _touch_live_stream(stream_id, LIVE_STREAMS[stream_id])
 
         self._send_json(
             200,
@@ -703,7 +1454,7 @@ class APIMockHandler(BaseHTTPRequestHandler):
         )
 
     def _handle_live_chunk(self):
-        self._cleanup_stale_live_streams()
+        _cleanup_stale_live_streams()
         content_type = (self.headers.get("Content-Type", "") or "").lower()
         if not content_type.startswith("multipart/form-data"):
             self._send_json(400, {"ok": False, "error": "Use multipart/form-data"})
@@ -720,6 +1471,16 @@ class APIMockHandler(BaseHTTPRequestHandler):
             self._send_json(404, {"ok": False, "error": "Stream not found"})
             return
 
+        # Chunks for one stream are applied one at a time; other streams
+        # proceed in parallel.
+        with stream_state["lock"]:
+            self._apply_live_chunk(stream_id, stream_state, body)
+
+    def _apply_live_chunk(self, stream_id, stream_state, body):
+        if LIVE_STREAMS.get(stream_id) is not stream_state:
+            self._send_json(404, {"ok": False, "error": "Stream not found"})
+            return
+
         chunk = body.get("chunk")
         if not isinstance(chunk, dict):
             self._send_json(400, {"ok": False, "error": "Audio chunk is required"})
@@ -728,42 +1489,43 @@ class APIMockHandler(BaseHTTPRequestHandler):
         if not isinstance(chunk_bytes, (bytes, bytearray)):
             self._send_json(400, {"ok": False, "error": "Invalid chunk bytes"})
             return
-        chunk_bytes = bytes(chunk_bytes)
         if len(chunk_bytes) > LIVE_CHUNK_MAX_BYTES:
             self._send_json(413, {"ok": False, "error": "Chunk too large"})
             return
-
-        event = get_event_by_id(stream_state.get("event_id"))
-        if not event:
-            LIVE_STREAMS.pop(stream_id, None)
-            self._send_json(404, {"ok": False, "error": "Event not found for stream"})
+        # The stream is mirrored in memory and sent to the model whole, so
+        # it is held to the same limit as a single uploaded file.
+        if int(stream_state.get("total_bytes", 0)) + len(chunk_bytes) > MAX_AUDIO_BYTES:
+            self._send_json(413, {"ok": False, "error": "Stream audio too large"})
             return
 
-        live_path = stream_state.get("file_path")
-        if not live_path:
-            self._send_json(500, {"ok": False, "error": "Stream file path missing"})
+        live_fd = stream_state.get("fd")
+        if live_fd is None:
+            self._send_json(500, {"ok": False, "error": "Stream file missing"})
             return
 
-        with open(live_path, "ab") as f:
-            f.write(chunk_bytes)
+        # The audio is written before progress is recorded, so the stored
+        # counters never cover bytes that failed to reach the file.
+        _write_all(live_fd, chunk_bytes)
+        stream_state["audio"] += chunk_bytes
 
         stream_state["chunk_count"] = int(stream_state.get("chunk_count", 0)) + 1
         stream_state["total_bytes"] = int(stream_state.get("total_bytes", 0)) + len(chunk_bytes)
-        stream_state["last_activity"] = datetime.now(timezone.utc)
+        _touch_live_stream(stream_id, stream_state)
         if body.get("mime_type"):
             stream_state["audio_mime_type"] = body.get("mime_type")
 
-        payload = dict(event.get("payload", {}))
-        streaming = payload.get("streaming")
-        if not isinstance(streaming, dict):
-            streaming = {}
-        streaming["status"] = "streaming"
-        streaming["last_chunk_at"] = _iso_now()
-        streaming["chunks_received"] = stream_state["chunk_count"]
-        streaming["total_bytes"] = stream_state["total_bytes"]
-        payload["streaming"] = streaming
-        update_event_payload(event["id"], payload)
-        event["payload"] = payload
+        # Progress is merged into payload.streaming inside SQLite, so most
+        # chunks never read or re-serialize the event.
+        progress = {
+            "status": "streaming",
+            "last_chunk_at": _iso_now(),
+            "chunks_received": stream_state["chunk_count"],
+            "total_bytes": stream_state["total_bytes"],
+        }
+        if not update_event_streaming(stream_state.get("event_id"), progress):
+            _close_live_stream(stream_id)
+            self._send_json(404, {"ok": False, "error": "Event not found for stream"})
+            return
 
         if stream_state["chunk_count"] % LIVE_PARTIAL_EVERY_CHUNKS != 0:
             self._send_json(
@@ -778,10 +1540,17 @@ class APIMockHandler(BaseHTTPRequestHandler):
             )
             return
 
-        with open(live_path, "rb") as f:
-            merged_audio = f.read()
+        event = get_event_by_id(stream_state.get("event_id"))
+        if not event:
+            _close_live_stream(stream_id)
+            self._send_json(404, {"ok": False, "error": "Event not found for stream"})
+            return
+
+        # Reasoning runs under the stream lock, so the mirror is not
+        # modified while it is being read.
+        merged_audio = stream_state["audio"]
 
-        recent_events = self._recent_events_excluding(event.get("id"))
+        recent_events = _recent_events_excluding(event.get("id"))
         priors = load_reasoning_priors(MEMORY_FILE, event.get("occurred_at"))
         reasoning_start = time.perf_counter()
         enrichment, error = run_reasoning(
@@ -819,7 +1588,10 @@ class APIMockHandler(BaseHTTPRequestHandler):
             partial_meta = dict(enrichment.get("ai_meta", {}))
             partial_meta["request_mode"] = "multimodal_partial"
 
-            payload = dict(event.get("payload", {}))
+            payload = event.get("payload")
+            if not isinstance(payload, dict):
+                payload = {}
+                event["payload"] = payload
             streaming = payload.get("streaming")
             if not isinstance(streaming, dict):
                 streaming = {}
@@ -853,7 +1625,10 @@ class APIMockHandler(BaseHTTPRequestHandler):
             )
             return
 
-        payload = dict(event.get("payload", {}))
+        payload = event.get("payload")
+        if not isinstance(payload, dict):
+            payload = {}
+            event["payload"] = payload
         streaming = payload.get("streaming")
         if not isinstance(streaming, dict):
             streaming = {}
@@ -877,7 +1652,7 @@ class APIMockHandler(BaseHTTPRequestHandler):
         )
 
     def _handle_live_finish(self):
-        self._cleanup_stale_live_streams()
+        _cleanup_stale_live_streams()
         body = self._read_json()
         if body is None:
             self._send_json(400, {"ok": False, "error": "Invalid JSON"})
@@ -892,27 +1667,34 @@ class APIMockHandler(BaseHTTPRequestHandler):
             self._send_json(404, {"ok": False, "error": "Stream not found"})
             return
 
+        with stream_state["lock"]:
+            self._finish_live_stream(stream_id, stream_state)
+
+    def _finish_live_stream(self, stream_id, stream_state):
+        if LIVE_STREAMS.get(stream_id) is not stream_state:
+            self._send_json(404, {"ok": False, "error": "Stream not found"})
+            return
+
         event = get_event_by_id(stream_state.get("event_id"))
         if not event:
-            LIVE_STREAMS.pop(stream_id, None)
+            _close_live_stream(stream_id)
             self._send_json(404, {"ok": False, "error": "Event not found for stream"})
             return
 
-        live_path = stream_state.get("file_path")
-        audio_bytes = b""
-        if live_path and os.path.exists(live_path):
-            with open(live_path, "rb") as f:
-                audio_bytes = f.read()
+        audio_bytes = stream_state.get("audio") or b""
 
         assigned_variant = stream_state.get("assigned_variant") or "treatment"
-        event, success, error = self._apply_reasoning_to_event(
+        event, success, error = _apply_reasoning_to_event(
             event,
             audio_bytes=audio_bytes,
             audio_mime_type=stream_state.get("audio_mime_type"),
             assigned_variant=assigned_variant,
         )
 
-        payload = dict(event.get("payload", {}))
+        payload = event.get("payload")
+        if not isinstance(payload, dict):
+            payload = {}
+            event["payload"] = payload
         streaming = payload.get("streaming")
         if not isinstance(streaming, dict):
             streaming = {}
@@ -924,9 +1706,8 @@ class APIMockHandler(BaseHTTPRequestHandler):
             streaming["final_error"] = error
         payload["streaming"] = streaming
         update_event_payload(event["id"], payload)
-        event["payload"] = payload
 
-        LIVE_STREAMS.pop(stream_id, None)
+        _close_live_stream(stream_id)
         self._send_json(
             200,
             {
@@ -947,34 +1728,15 @@ class APIMockHandler(BaseHTTPRequestHandler):
         self._send_json(200, {"ok": True, "events": events})
 
     def _handle_get_summary(self):
-        events = fetch_events_since(datetime.now(timezone.utc) - timedelta(hours=24))
         now = datetime.now(timezone.utc)
         cutoff = now - timedelta(hours=24)
-
+        by_category, latest_events = fetch_summary_since(cutoff, 10)
         counts = {
-            "feeding_count": 0,
-            "diaper_count": 0,
-            "sleep_sessions": 0,
-            "crying_events": 0
+            "feeding_count": by_category.get("feeding", 0),
+            "diaper_count": by_category.get("diaper", 0),
+            "sleep_sessions": by_category.get("sleep", 0),
+            "crying_events": by_category.get("crying", 0)
         }
-        recent_events = []
-        for event in events:
-            dt = _parse_iso(event.get("occurred_at")) or _parse_iso(event.get("created_at"))
-            if not dt:
-                continue
-            if dt >= cutoff:
-                recent_events.append(event)
-                category = event.get("category")
-                if category == "feeding":
-                    counts["feeding_count"] += 1
-                elif category == "diaper":
-                    counts["diaper_count"] += 1
-                elif category == "sleep":
-                    counts["sleep_sessions"] += 1
-                elif category == "crying":
-                    counts["crying_events"] += 1
-
-        latest_events = recent_events[:10]
         summary = {
             "last_24h": counts,
             "latest_events": latest_events,
@@ -983,75 +1745,39 @@ class APIMockHandler(BaseHTTPRequestHandler):
         self._send_json(200, {"ok": True, "summary": summary})
 
     def _build_metrics(self):
-        crying_events = fetch_events_by_category("crying")
-        helpful_total = 0
-        helpful_hits = 0
-        resolved_minutes = []
-
-        with_context_total = 0
-        with_context_helpful = 0
-        with_context_resolved = []
-        limited_context_total = 0
-        limited_context_helpful = 0
-        limited_context_resolved = []
-        ab_treatment_total = 0
-        ab_treatment_helpful = 0
-        ab_treatment_resolved = []
-        ab_control_total = 0
-        ab_control_helpful = 0
-        ab_control_resolved = []
-
-        for event in crying_events:
-            payload = event.get("payload", {})
-            if not isinstance(payload, dict):
-                continue
-
-            feedback = payload.get("user_feedback")
-            if not isinstance(feedback, dict):
-                continue
-            helpful = feedback.get("helpful")
-            if not isinstance(helpful, bool):
-                continue
-
-            helpful_total += 1
-            if helpful:
-                helpful_hits += 1
-
-            resolved_in = feedback.get("resolved_in_minutes")
-            if isinstance(resolved_in, (int, float)):
-                resolved_minutes.append(float(resolved_in))
+        crying_count, feedback_rows = fetch_feedback_rows("crying")
+        # One [total, helpful, resolved_minutes] counter per bucket; every
+        # feedback event lands in "all", one context bucket and at most one
+        # A/B bucket.
+        counters = {
+            name: [0, 0, array("d")] for name in _METRICS_BUCKETS
+        }
+        overall = counters["all"]
+        with_context = counters["with_context"]
+        limited_context = counters["limited_context"]
+        ab_buckets = {
+            "treatment": counters["treatment"],
+            "control": counters["control"],
+        }
 
-            ai_guidance = payload.get("ai_guidance")
-            has_limited_context = isinstance(ai_guidance, dict) and bool(ai_guidance.get("uncertainty_note"))
-            if has_limited_context:
-                limited_context_total += 1
-                if helpful:
-                    limited_context_helpful += 1
-                if isinstance(resolved_in, (int, float)):
-                    limited_context_resolved.append(float(resolved_in))
-            else:
-                with_context_total += 1
+        # Rows arrive pre-filtered and flattened by SQLite.
+        for helpful, resolved_in, has_limited_context, variant in feedback_rows:
+            context_bucket = limited_context if has_limited_context else with_context
+            ab_bucket = ab_buckets.get(variant)
+            for bucket in (overall, context_bucket, ab_bucket):
+                if bucket is None:
+                    continue
+                bucket[0] += 1
                 if helpful:
-                    with_context_helpful += 1
-                if isinstance(resolved_in, (int, float)):
-                    with_context_resolved.append(float(resolved_in))
-
-            ab_test = payload.get("ab_test")
-            variant = None
-            if isinstance(ab_test, dict):
-                variant = ab_test.get("shown_variant") or ab_test.get("assigned_variant")
-            if variant == "treatment":
-                ab_treatment_total += 1
-                if helpful:
-                    ab_treatment_helpful += 1
-                if isinstance(resolved_in, (int, float)):
-                    ab_treatment_resolved.append(float(resolved_in))
-            elif variant == "control":
-                ab_control_total += 1
-                if helpful:
-                    ab_control_helpful += 1
-                if isinstance(resolved_in, (int, float)):
-                    ab_control_resolved.append(float(resolved_in))
+                    bucket[1] += 1
+                if resolved_in is not None:
+                    bucket[2].append(resolved_in)
+
+        helpful_total, helpful_hits, resolved_minutes = overall
+        with_context_total, with_context_helpful, with_context_resolved = with_context
+        limited_context_total, limited_context_helpful, limited_context_resolved = limited_context
+        ab_treatment_total, ab_treatment_helpful, ab_treatment_resolved = counters["treatment"]
+        ab_control_total, ab_control_helpful, ab_control_resolved = counters["control"]
 
         helpful_rate = None
         if helpful_total > 0:
@@ -1137,83 +1863,41 @@ class APIMockHandler(BaseHTTPRequestHandler):
                 "median_resolved_minutes_delta": ab_median_resolved_minutes_delta,
             },
             "totals": {
-                "crying_events": len(crying_events),
+                "crying_events": crying_count,
                 "feedback_events": helpful_total,
             },
         }
 
     def _handle_get_metrics(self):
-        self._send_json(200, {"ok": True, "metrics": self._build_metrics()})
+        version = events_version()
+        now = time.monotonic()
+        entry = _METRICS_CACHE["entry"]
+        expired = entry is not None and now - entry[1] > METRICS_CACHE_TTL_SEC
+        if entry is None or entry[0] != version or expired:
+            if expired:
+                sync_feedback_index()
+            payload = {"ok": True, "metrics": self._build_metrics()}
+            entry = (version, now, _encode_json(payload))
+            _METRICS_CACHE["entry"] = entry
+        self._send_json_body(200, entry[2])
 
     def _handle_metrics_page(self):
-        html = """<!doctype html>
-<html lang="en">
-<head>
-  <meta charset="utf-8" />
-  <meta name="viewport" content="width=device-width, initial-scale=1" />
-  <title>WMBC Metrics</title>
-  <style>
-    body { font-family: Arial, sans-serif; margin: 2rem; background: #f7f8fa; color: #111; }
-    .card { max-width: 980px; background: white; border-radius: 12px; padding: 1.2rem; box-shadow: 0 4px 24px rgba(0,0,0,0.08); }
-    table { width: 100%; border-collapse: collapse; margin-bottom: 1rem; }
-    th, td { border: 1px solid #dbe1e8; padding: 0.5rem; text-align: left; }
-    th { background: #f0f4f8; }
-    pre { white-space: pre-wrap; background: #10151c; color: #d8ecff; border-radius: 10px; padding: 1rem; }
-  </style>
-</head>
-<body>
-  <div class="card">
-    <h2>Care Guidance Metrics</h2>
-    <p>Live metrics from <code>/api/metrics</code></p>
-    <table>
-      <thead>
-        <tr><th>Variant</th><th>Samples</th><th>Helpful Rate</th><th>Median Resolved (min)</th></tr>
-      </thead>
-      <tbody id="ab_table">
-        <tr><td colspan="4">Loading...</td></tr>
-      </tbody>
-    </table>
-    <p id="uplift_line"></p>
-    <pre id="output">Loading...</pre>
-  </div>
-  <script>
-    fetch('/api/metrics')
-      .then(function (res) { return res.json(); })
-      .then(function (data) {
-        var metrics = data.metrics || {};
-        var ab = metrics.ab_comparison || {};
-        var treatment = ab.treatment || {};
-        var control = ab.control || {};
-        var abUplift = metrics.ab_uplift || {};
-        var show = function (value) {
-          if (value === null || value === undefined) {
-            return '-';
-          }
-          return String(value);
-        };
-        var rows = [
-          '<tr><td>Treatment</td><td>' + show(treatment.samples) + '</td><td>' + show(treatment.helpful_rate) + '</td><td>' + show(treatment.median_resolved_minutes) + '</td></tr>',
-          '<tr><td>Control</td><td>' + show(control.samples) + '</td><td>' + show(control.helpful_rate) + '</td><td>' + show(control.median_resolved_minutes) + '</td></tr>'
-        ];
-        document.getElementById('ab_table').innerHTML = rows.join('');
-        document.getElementById('uplift_line').textContent =
-          'A/B Uplift: helpful_rate=' + show(abUplift.helpful_rate_uplift) +
-          ', median_resolved_minutes_delta=' + show(abUplift.median_resolved_minutes_delta);
-        document.getElementById('output').textContent = JSON.stringify(data, null, 2);
-      })
-      .catch(function (err) {
-        document.getElementById('output').textContent = 'Error: ' + err;
-      });
-  </script>
-</body>
-</html>"""
-        body = html.encode("utf-8")
-        self.send_response(200)
-        self.send_header("Content-Type", "text/html; charset=utf-8")
-        self.send_header("Content-Length", str(len(body)))
-        self.send_header("Access-Control-Allow-Origin", "*")
-        self.end_headers()
-        self.wfile.write(body)
+        use_gzip = _accepts_gzip(self.headers.get("Accept-Encoding"))
+        etag = _METRICS_PAGE_GZIP_ETAG if use_gzip else _METRICS_PAGE_ETAG
+        if_none_match = self.headers.get("If-None-Match")
+        if if_none_match:
+            tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+            # A cached copy of either encoding is still current; the 304
+            # names the copy it validates.
+            if "*" not in tags and etag not in tags:
+                etag = next((tag for tag in tags if tag in _METRICS_PAGE_NOT_MODIFIED_HEADERS), None)
+            if etag is not None:
+                self._send_without_body(304, _METRICS_PAGE_NOT_MODIFIED_HEADERS[etag])
+                return
+        if use_gzip:
+            self._send_body(200, _METRICS_PAGE_GZIP_HEADERS, _METRICS_PAGE_GZIP)
+        else:
+            self._send_body(200, _METRICS_PAGE_HEADERS, _METRICS_PAGE_BODY)
 
     def _handle_get_event_by_id(self, path):
         parts = path.rstrip("/").split("/")
@@ -1241,158 +1925,37 @@ class APIMockHandler(BaseHTTPRequestHandler):
         if not event:
             self._send_json(404, {"ok": False, "error": "Event not found"})
             return
-        payload = dict(event.get("payload", {}))
-        payload["user_feedback"] = feedback
         learning_update = update_reasoning_priors(MEMORY_FILE, event, feedback)
-        if learning_update:
-            payload["learning_update"] = learning_update
-        update_event_payload(event_id, payload)
-        event["payload"] = payload
-        self._send_json(200, {"ok": True, "event": event, "learning": learning_update})
+        updated = update_event_feedback(event_id, feedback, learning_update)
+        if updated is None:
+            self._send_json(404, {"ok": False, "error": "Event not found"})
+            return
+        self._send_json(200, {"ok": True, "event": updated, "learning": learning_update})
 
     def _handle_root(self):
-        payload = {
-            "ok": True,
-            "service": "wmbc-api-mock",
-            "endpoints": [
-                "POST /api/events/manual",
-                "POST /api/events/crying",
-                "POST /api/events/crying/live/start",
-                "POST /api/events/crying/live/chunk",
-                "POST /api/events/crying/live/finish",
-                "POST /api/events/feedback",
-                "GET /api/events/recent",
-                "GET /api/events/{id}",
-                "GET /api/context/summary",
-                "GET /api/metrics",
-                "GET /docs",
-                "GET /metrics",
-                "GET /health"
-            ]
-        }
-        self._send_json(200, payload)
+        self._send_json_body(200, _ROOT_BODY)
 
     def _handle_docs(self):
-        payload = {
-            "ok": True,
-            "title": "WhyMyBabyCries API Mock",
-            "base_url": "http://localhost:8000",
-            "endpoints": [
-                {
-                    "method": "POST",
-                    "path": "/api/events/manual",
-                    "body": {
-                        "occurred_at": "2026-02-08T09:30:12Z",
-                        "category": "feeding|diaper|sleep|comfort",
-                        "payload": {"note": "optional"},
-                        "tags": ["optional"]
-                    }
-                },
-                {
-                    "method": "POST",
-                    "path": "/api/events/crying",
-                    "content_types": ["application/json", "multipart/form-data"],
-                    "response_additions": [
-                        "payload.ai_meta.model_name",
-                        "payload.ai_meta.latency_ms",
-                        "payload.ai_meta.request_mode",
-                        "payload.notice (may include safety reminder)"
-                    ],
-                    "body": {
-                        "occurred_at": "2026-02-08T10:02:00Z",
-                        "ab_variant": "treatment|control (optional, for A/B demo)",
-                        "audio_id": "aud_20260208_100200_000000",
-                        "audio_url": "s3://.../cry.wav",
-                        "payload": {"note": "optional"},
-                        "tags": ["optional"]
-                    }
-                },
-                {
-                    "method": "POST",
-                    "path": "/api/events/crying/live/start",
-                    "body": {
-                        "occurred_at": "2026-02-08T10:02:00Z",
-                        "ab_variant": "treatment|control (optional)",
-                        "audio_mime_type": "audio/webm",
-                        "payload": {"note": "optional"},
-                        "tags": ["optional"]
-                    },
-                    "response": {
-                        "stream_id": "str_...",
-                        "event_id": "evt_...",
-                        "status": "streaming"
-                    }
-                },
-                {
-                    "method": "POST",
-                    "path": "/api/events/crying/live/chunk",
-                    "content_types": ["multipart/form-data"],
-                    "form_fields": ["stream_id", "chunk(file)", "mime_type(optional)"],
-                    "response_notes": [
-                        "returns partial_guidance every 3 chunks",
-                        "returns stale=true on partial failure without blocking stream"
-                    ]
-                },
-                {
-                    "method": "POST",
-                    "path": "/api/events/crying/live/finish",
-                    "body": {
-                        "stream_id": "str_..."
-                    },
-                    "response": {
-                        "status": "completed",
-                        "event": "final crying event"
-                    }
-                },
-                {
-                    "method": "POST",
-                    "path": "/api/events/feedback",
-                    "body": {
-                        "event_id": "evt_20260208_100200_000000",
-                        "feedback": {
-                            "helpful": True,
-                            "resolved_in_minutes": 5,
-                            "notes": "Feeding worked quickly"
-                        }
-                    }
-                },
-                {
-                    "method": "GET",
-                    "path": "/api/events/recent",
-                    "query": {
-                        "limit": "50",
-                        "since": "2026-02-08T00:00:00Z"
-                    }
-                },
-                {
-                    "method": "GET",
-                    "path": "/api/events/{id}"
-                },
-                {
-                    "method": "GET",
-                    "path": "/api/context/summary"
-                },
-                {
-                    "method": "GET",
-                    "path": "/api/metrics",
-                    "contains": [
-                        "metrics.ab_uplift.helpful_rate_uplift",
-                        "metrics.ab_uplift.median_resolved_minutes_delta",
-                        "metrics.uplift.helpful_rate_uplift",
-                        "metrics.uplift.median_resolved_minutes_delta"
-                    ]
-                },
-                {
-                    "method": "GET",
-                    "path": "/metrics"
-                },
-                {
-                    "method": "GET",
-                    "path": "/health"
-                }
-            ]
-        }
-        self._send_json(200, payload)
+        self._send_json_body(200, _DOCS_BODY)
+
+    # Exact-path dispatch; /api/events/recent (needs the query) and
+    # /api/events/{id} are matched in do_GET after a miss.
+    _POST_ROUTES = {
+        "/api/events/manual": _handle_post_manual,
+        "/api/events/crying/live/start": _handle_live_start,
+        "/api/events/crying/live/chunk": _handle_live_chunk,
+        "/api/events/crying/live/finish": _handle_live_finish,
+        "/api/events/crying": _handle_post_crying,
+        "/api/events/feedback": _handle_post_feedback,
+    }
+    _GET_ROUTES = {
+        "/": _handle_root,
+        "/docs": _handle_docs,
+        "/metrics": _handle_metrics_page,
+        "/health": _handle_health,
+        "/api/metrics": _handle_get_metrics,
+        "/api/context/summary": _handle_get_summary,
+    }
 
 
 def run(host="0.0.0.0", port=8000):
@@ -1400,9 +1963,14 @@ def run(host="0.0.0.0", port=8000):
     os.makedirs(UPLOAD_DIR, exist_ok=True)
     os.makedirs(os.path.join(UPLOAD_DIR, "live"), exist_ok=True)
     migrated = migrate_events_from_memory(MEMORY_FILE)
+    migrated += migrate_events_from_log(AGENT_EVENTS_FILE)
     if migrated:
         print(f"[API Mock] Migrated {migrated} events from memory.json")
-    server = HTTPServer((host, port), APIMockHandler)
+    server = ThreadingHTTPServer((host, port), APIMockHandler)
+    server.daemon_threads = True
+    threading.Thread(
+        target=_live_stream_sweeper, name="live-stream-sweeper", daemon=True
+    ).start()
     print(f"[API Mock] Listening on http://{host}:{port}")
     server.serve_forever()
 
@@ -1,68 +1,146 @@
 import json
 import os
 import sqlite3
+import threading
 from datetime import timezone
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DB_FILE = os.path.join(BASE_DIR, "..", "db.sqlite")
+# Bumped on every write made through this module, so callers can cache
+# derived results and tell when they are stale.
+_WRITE_VERSION = [0]
+_WRITE_VERSION_LOCK = threading.Lock()
+
+
+def events_version():
+    return _WRITE_VERSION[0]
+
+
+def _bump_write_version():
+    # Writers run on many server threads; an unlocked += can lose a bump
+    # and leave version-keyed caches serving stale results.
+    with _WRITE_VERSION_LOCK:
+        _WRITE_VERSION[0] += 1
+    _note_own_write()
+
+
+# Columns are TEXT, so encoded JSON is stored as str either way.
+if orjson is not None:
+    _loads = orjson.loads
+
+    def _dumps(obj):
+        return orjson.dumps(obj).decode("utf-8")
+else:
+    _loads = json.loads
+
+    def _dumps(obj):
+        return json.dumps(obj, ensure_ascii=False)
+
+
+# One connection per thread, reused across calls so sqlite3's statement
+# cache keeps hot queries prepared. Keyed by path so a changed DB_FILE
+# gets a fresh connection.
+_LOCAL = threading.local()
+STATEMENT_CACHE_SIZE = 256
 
 
 def get_conn():
-    conn = sqlite3.connect(DB_FILE)
+    conn = getattr(_LOCAL, "conn", None)
+    if conn is not None and _LOCAL.path == DB_FILE:
+        return conn
+    if conn is not None:
+        conn.close()
+    conn = sqlite3.connect(DB_FILE, cached_statements=STATEMENT_CACHE_SIZE)
     conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA cache_size=-20000")
+    # Per-connection settings; journal_mode is set once in init_db().
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA mmap_size=268435456")
+    _LOCAL.conn = conn
+    _LOCAL.path = DB_FILE
     return conn
 
 
 def init_db():
-    conn = get_conn()
-    conn.execute(
-        """
-        CREATE TABLE IF NOT EXISTS events (
-            id TEXT PRIMARY KEY,
-            type TEXT NOT NULL,
-            occurred_at TEXT NOT NULL,
-            source TEXT NOT NULL,
-            category TEXT NOT NULL,
-            payload_json TEXT NOT NULL,
-            tags_json TEXT NOT NULL,
-            created_at TEXT NOT NULL
+    # WAL lets readers run while a write is in progress; the mode is stored
+    # in the database file, so later connections pick it up.
+    get_conn().execute("PRAGMA journal_mode=WAL")
+    with get_conn() as conn:
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS events (
+                id TEXT PRIMARY KEY,
+                type TEXT NOT NULL,
+                occurred_at TEXT NOT NULL,
+                source TEXT NOT NULL,
+                category TEXT NOT NULL,
+                payload_json TEXT NOT NULL,
+                tags_json TEXT NOT NULL,
+                created_at TEXT NOT NULL
+            )
+            """
         )
-        """
-    )
-    conn.execute(
-        "CREATE INDEX IF NOT EXISTS idx_events_occurred_at ON events (occurred_at)"
-    )
-    conn.commit()
-    conn.close()
+        # (occurred_at, category) serves the time-ordered reads;
+        # (category, occurred_at) covers the per-category feedback lookups
+        # and the summary's counts. They replace the single-column indexes.
+        conn.execute("DROP INDEX IF EXISTS idx_events_occurred_at")
+        conn.execute("DROP INDEX IF EXISTS idx_events_category")
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_events_occurred_cat "
+            "ON events (occurred_at DESC, category)"
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_events_category_occurred "
+            "ON events (category, occurred_at)"
+        )
+        # Let SQLite refresh planner statistics only for tables whose stats
+        # are missing or stale, so the covering index is picked for the
+        # summary counts without a full ANALYZE on every start.
+        conn.execute("PRAGMA optimize")
 
 
 def insert_event(event):
-    conn = get_conn()
-    conn.execute(
-        """
-        INSERT OR IGNORE INTO events (
-            id, type, occurred_at, source, category,
-            payload_json, tags_json, created_at
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        """,
-        (
-            event["id"],
-            event["type"],
-            event["occurred_at"],
-            event["source"],
-            event["category"],
-            json.dumps(event.get("payload", {}), ensure_ascii=False),
-            json.dumps(event.get("tags", []), ensure_ascii=False),
-            event["created_at"],
-        )
-    )
-    conn.commit()
-    conn.close()
+    """Insert a new event; returns False if its id is already taken."""
+    try:
+        with get_conn() as conn:
+            conn.execute(
+                """
+                INSERT INTO events (
+                    id, type, occurred_at, source, category,
+                    payload_json, tags_json, created_at
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    event["id"],
+                    event["type"],
+                    event["occurred_at"],
+                    event["source"],
+                    event["category"],
+                    _dumps(event.get("payload", {})),
+                    _dumps(event.get("tags", [])),
+                    event["created_at"],
+                )
+            )
+    except sqlite3.IntegrityError as exc:
+        # Only a primary key collision is a duplicate id; NOT NULL and
+        # other constraint failures are real errors.
+        if str(exc) != "UNIQUE constraint failed: events.id":
+            raise
+        return False
+    _bump_write_version()
+    _mark_feedback_dirty(event["id"])
+    return True
 
 
 def row_to_event(row):
-    payload = json.loads(row["payload_json"]) if row["payload_json"] else {}
-    tags = json.loads(row["tags_json"]) if row["tags_json"] else []
+    payload = _loads(row["payload_json"]) if row["payload_json"] else {}
+    tags = _loads(row["tags_json"]) if row["tags_json"] else []
     return {
         "id": row["id"],
         "type": row["type"],
@@ -101,7 +179,6 @@ def fetch_recent_events(limit, since_dt=None):
             """,
             (limit,)
         ).fetchall()
-    conn.close()
     return [row_to_event(row) for row in rows]
 
 
@@ -120,7 +197,6 @@ def fetch_events_since(cutoff_dt):
         """,
         (cutoff_iso,)
     ).fetchall()
-    conn.close()
     return [row_to_event(row) for row in rows]
 
 
@@ -134,73 +210,318 @@ def fetch_events_by_category(category):
         """,
         (category,)
     ).fetchall()
-    conn.close()
     return [row_to_event(row) for row in rows]
 
 
+def fetch_summary_since(cutoff_dt, latest_limit):
+    """
+    Return ({category: count}, latest_events) for events at or after
+    cutoff_dt, using one connection for both queries. The handlers store
+    occurred_at as a UTC ...Z stamp, so the string compare is a time
+    compare.
+    """
+    cutoff_iso = (
+        cutoff_dt.astimezone(timezone.utc)
+        .isoformat()
+        .replace("+00:00", "Z")
+    )
+    conn = get_conn()
+    count_rows = conn.execute(
+        """
+        SELECT category, COUNT(*) AS n FROM events
+        WHERE occurred_at >= ?
+        GROUP BY category
+        """,
+        (cutoff_iso,)
+    ).fetchall()
+    latest_rows = conn.execute(
+        """
+        SELECT * FROM events
+        WHERE occurred_at >= ?
+        ORDER BY occurred_at DESC
+        LIMIT ?
+        """,
+        (cutoff_iso, latest_limit)
+    ).fetchall()
+    counts = {row["category"]: row["n"] for row in count_rows}
+    return counts, [row_to_event(row) for row in latest_rows]
+
+
+# Flattens the fields _build_metrics needs so rows cross into Python
+# already reduced to scalars. Mirrors the Python checks:
+# helpful must be a JSON boolean, resolved_in_minutes a number, and
+# limited_context follows Python truthiness of ai_guidance.uncertainty_note.
+_FEEDBACK_COLUMNS = """
+        id,
+        category,
+        json_type(payload_json, '$.user_feedback.helpful') IN ('true', 'false') AS has_feedback,
+        json_extract(payload_json, '$.user_feedback.helpful') AS helpful,
+        CASE json_type(payload_json, '$.user_feedback.resolved_in_minutes')
+            WHEN 'integer' THEN json_extract(payload_json, '$.user_feedback.resolved_in_minutes')
+            WHEN 'real' THEN json_extract(payload_json, '$.user_feedback.resolved_in_minutes')
+            -- Python counts bools as numbers here too.
+            WHEN 'true' THEN 1
+            WHEN 'false' THEN 0
+        END AS resolved_in,
+        CASE WHEN json_type(payload_json, '$.ai_guidance') = 'object' THEN
+            CASE json_type(payload_json, '$.ai_guidance.uncertainty_note')
+                WHEN 'true' THEN 1
+                WHEN 'text' THEN json_extract(payload_json, '$.ai_guidance.uncertainty_note') != ''
+                WHEN 'integer' THEN json_extract(payload_json, '$.ai_guidance.uncertainty_note') != 0
+                WHEN 'real' THEN json_extract(payload_json, '$.ai_guidance.uncertainty_note') != 0
+                WHEN 'array' THEN json_array_length(payload_json, '$.ai_guidance.uncertainty_note') > 0
+                WHEN 'object' THEN json_extract(payload_json, '$.ai_guidance.uncertainty_note') != '{}'
+                ELSE 0
+            END
+        ELSE 0 END AS limited_context,
+        CASE WHEN json_type(payload_json, '$.ab_test') = 'object' THEN
+            COALESCE(
+                NULLIF(json_extract(payload_json, '$.ab_test.shown_variant'), ''),
+                json_extract(payload_json, '$.ab_test.assigned_variant')
+            )
+        END AS variant
+"""
+_FEEDBACK_ROWS_SQL = f"SELECT {_FEEDBACK_COLUMNS} FROM events WHERE category = ?"
+_FEEDBACK_ROWS_BY_ID_SQL = (
+    f"SELECT {_FEEDBACK_COLUMNS} FROM events "
+    "WHERE id IN (SELECT value FROM json_each(?))"
+)
+
+# Per-category {event_id: row or None} built on first use, then patched
+# with only the events written since, so metrics never rescan the table.
+# Categories never change after insert, so a dirty id is re-read into the
+# index of whatever category it belongs to.
+_FEEDBACK_INDEX = {}
+_FEEDBACK_DIRTY = set()
+_FEEDBACK_LOCK = threading.Lock()
+
+
+def _mark_feedback_dirty(event_id):
+    # Called after the write commits, so a sync that races ahead of the
+    # mark still sees the new row.
+    with _FEEDBACK_LOCK:
+        if _FEEDBACK_INDEX:
+            _FEEDBACK_DIRTY.add(event_id)
+
+
+def _reset_feedback_index():
+    with _FEEDBACK_LOCK:
+        _FEEDBACK_INDEX.clear()
+        _FEEDBACK_DIRTY.clear()
+
+
+# PRAGMA data_version on this connection changes whenever another
+# connection commits. It is recorded after each write made through this
+# module, so a change seen later means a write from outside this process,
+# which the dirty set never heard about. A foreign write landing between
+# one of ours and its record is only noticed on the next one.
+_WATCH = {"conn": None, "path": None, "data_version": None}
+
+
+def _data_version():
+    # Caller holds _FEEDBACK_LOCK, which also serializes the shared
+    # connection.
+    if _WATCH["conn"] is None or _WATCH["path"] != DB_FILE:
+        _WATCH["conn"] = sqlite3.connect(DB_FILE, check_same_thread=False)
+        _WATCH["path"] = DB_FILE
+    return _WATCH["conn"].execute("PRAGMA data_version").fetchone()[0]
+
+
+def _note_own_write():
+    with _FEEDBACK_LOCK:
+        _WATCH["data_version"] = _data_version()
+
+
+def sync_feedback_index():
+    """
+    Drop the feedback index if the database changed outside this process
+    since the last write or check; in-process writes are already patched
+    in through the dirty set.
+    """
+    with _FEEDBACK_LOCK:
+        current = _data_version()
+        if current != _WATCH["data_version"]:
+            _FEEDBACK_INDEX.clear()
+            _FEEDBACK_DIRTY.clear()
+            _WATCH["data_version"] = current
+
+
+def _feedback_entry(row):
+    return tuple(row[3:]) if row[2] else None
+
+
+def fetch_feedback_rows(category):
+    """
+    Return (event_count, rows) for a category, where rows are
+    (helpful, resolved_in, limited_context, variant) tuples for events
+    that carry boolean feedback.
+    """
+    conn = get_conn()
+    with _FEEDBACK_LOCK:
+        if _FEEDBACK_DIRTY:
+            changed = conn.execute(
+                _FEEDBACK_ROWS_BY_ID_SQL, (_dumps(list(_FEEDBACK_DIRTY)),)
+            ).fetchall()
+            _FEEDBACK_DIRTY.clear()
+            for row in changed:
+                index = _FEEDBACK_INDEX.get(row[1])
+                if index is not None:
+                    index[row[0]] = _feedback_entry(row)
+        index = _FEEDBACK_INDEX.get(category)
+        if index is None:
+            index = {
+                row[0]: _feedback_entry(row)
+                for row in conn.execute(_FEEDBACK_ROWS_SQL, (category,))
+            }
+            _FEEDBACK_INDEX[category] = index
+        return len(index), [entry for entry in index.values() if entry is not None]
+
+
 def get_event_by_id(event_id):
     conn = get_conn()
     row = conn.execute(
         "SELECT * FROM events WHERE id = ?",
         (event_id,)
     ).fetchone()
-    conn.close()
     if not row:
         return None
     return row_to_event(row)
 
 
 def update_event_payload(event_id, payload):
-    conn = get_conn()
-    conn.execute(
-        """
-        UPDATE events
-        SET payload_json = ?
-        WHERE id = ?
-        """,
-        (json.dumps(payload, ensure_ascii=False), event_id)
-    )
-    conn.commit()
-    conn.close()
+    with get_conn() as conn:
+        conn.execute(
+            """
+            UPDATE events
+            SET payload_json = ?
+            WHERE id = ?
+            """,
+            (_dumps(payload), event_id)
+        )
+    _bump_write_version()
+    _mark_feedback_dirty(event_id)
+
+
+def update_event_streaming(event_id, fields):
+    """
+    Merge fields into payload.streaming inside SQLite, leaving the rest of
+    the payload as stored. Returns False if the event is missing.
+    """
+    with get_conn() as conn:
+        cursor = conn.execute(
+            """
+            UPDATE events
+            SET payload_json = json_set(payload_json, '$.streaming', json_patch(
+                CASE json_type(payload_json, '$.streaming')
+                    WHEN 'object' THEN json_extract(payload_json, '$.streaming')
+                    ELSE '{}'
+                END,
+                json(?)
+            ))
+            WHERE id = ?
+            """,
+            (_dumps(fields), event_id)
+        )
+    if cursor.rowcount <= 0:
+        return False
+    # payload.streaming feeds none of the feedback index columns.
+    _bump_write_version()
+    return True
+
+
+# UPDATE ... RETURNING needs SQLite 3.35+.
+_HAS_RETURNING = sqlite3.sqlite_version_info >= (3, 35)
+
+
+def update_event_feedback(event_id, feedback, learning_update=None):
+    """
+    Set payload.user_feedback (and payload.learning_update when given)
+    inside SQLite and return the updated event, or None if it is missing.
+    """
+    sql = "UPDATE events SET payload_json = json_set(payload_json, '$.user_feedback', json(?)"
+    params = [_dumps(feedback)]
+    if learning_update:
+        sql += ", '$.learning_update', json(?)"
+        params.append(_dumps(learning_update))
+    sql += ") WHERE id = ?"
+    params.append(event_id)
+
+    with get_conn() as conn:
+        if _HAS_RETURNING:
+            row = conn.execute(sql + " RETURNING *", params).fetchone()
+        elif conn.execute(sql, params).rowcount > 0:
+            # Same transaction, so the row read back is the one just written.
+            row = conn.execute(
+                "SELECT * FROM events WHERE id = ?", (event_id,)
+            ).fetchone()
+        else:
+            row = None
+    if not row:
+        return None
+    _bump_write_version()
+    _mark_feedback_dirty(event_id)
+    return row_to_event(row)
+
+
+def _insert_migrated_events(events):
+    with get_conn() as conn:
+        count = 0
+        for event in events:
+            cursor = conn.execute(
+                """
+                INSERT OR IGNORE INTO events (
+                    id, type, occurred_at, source, category,
+                    payload_json, tags_json, created_at
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    event.get("id"),
+                    event.get("type", "manual"),
+                    event.get("occurred_at"),
+                    event.get("source", "parent"),
+                    event.get("category", "unknown"),
+                    _dumps(event.get("payload", {})),
+                    _dumps(event.get("tags", [])),
+                    event.get("created_at") or event.get("occurred_at"),
+                )
+            )
+            if cursor.rowcount and cursor.rowcount > 0:
+                count += cursor.rowcount
+    if count:
+        _bump_write_version()
+        _reset_feedback_index()
+    return count
 
 
 def migrate_events_from_memory(memory_file):
     if not os.path.exists(memory_file):
         return 0
-    with open(memory_file, "r", encoding="utf-8") as f:
-        content = f.read().strip()
-        if not content:
-            return 0
-        try:
-            data = json.loads(content)
-        except json.JSONDecodeError:
-            return 0
+    with open(memory_file, "rb") as f:
+        content = f.read()
+    if not content.strip():
+        return 0
+    try:
+        data = _loads(content)
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        return 0
     events = data.get("events", [])
     if not events:
         return 0
-    conn = get_conn()
-    count = 0
-    for event in events:
-        cursor = conn.execute(
-            """
-            INSERT OR IGNORE INTO events (
-                id, type, occurred_at, source, category,
-                payload_json, tags_json, created_at
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            """,
-            (
-                event.get("id"),
-                event.get("type", "manual"),
-                event.get("occurred_at"),
-                event.get("source", "parent"),
-                event.get("category", "unknown"),
-                json.dumps(event.get("payload", {}), ensure_ascii=False),
-                json.dumps(event.get("tags", []), ensure_ascii=False),
-                event.get("created_at") or event.get("occurred_at"),
-            )
-        )
-        if cursor.rowcount and cursor.rowcount > 0:
-            count += cursor.rowcount
-    conn.commit()
-    conn.close()
-    return count
+    return _insert_migrated_events(events)
+
+
+def migrate_events_from_log(events_file):
+    if not os.path.exists(events_file):
+        return 0
+    events = []
+    with open(events_file, "rb") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                events.append(_loads(line))
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                continue
+    if not events:
+        return 0
+    return _insert_migrated_events(events)
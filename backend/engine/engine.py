@@ -10,6 +10,7 @@ import json
 import os
 import time
 from datetime import datetime, timezone
+from functools import lru_cache
 
 import requests
 
@@ -20,19 +21,36 @@ SCHEMA_FILE = os.path.join(BASE_DIR, "schema.json")
 CAUSE_LABELS = ("hunger", "discomfort", "emotional_need", "unknown")
 
 
+# Prompt and schema are static files; read them once per process.
+@lru_cache(maxsize=1)
 def _load_prompt():
     with open(PROMPT_FILE, "r", encoding="utf-8") as f:
         return f.read().strip()
 
 
+@lru_cache(maxsize=1)
 def _load_schema():
     with open(SCHEMA_FILE, "r", encoding="utf-8") as f:
         return json.load(f)
 
 
-def _parse_iso(value):
-    if not value:
+def parse_iso(value):
+    """
+    Parse an ISO-8601 string to an aware datetime (naive values are taken
+    as UTC), or return None. Shared by app.py and learning.py.
+    """
+    if not value or not isinstance(value, str):
         return None
+    # Fast path for the server's own stamps: YYYY-MM-DDTHH:MM:SS.ffffffZ
+    if len(value) == 27 and value[26] == "Z" and value[4] == "-" and value[19] == ".":
+        try:
+            return datetime(
+                int(value[0:4]), int(value[5:7]), int(value[8:10]),
+                int(value[11:13]), int(value[14:16]), int(value[17:19]),
+                int(value[20:26]), timezone.utc,
+            )
+        except ValueError:
+            pass
     try:
         if value.endswith("Z"):
             value = value[:-1] + "+00:00"
@@ -45,7 +63,7 @@ def _parse_iso(value):
 
 
 def _minutes_since(iso_time):
-    dt = _parse_iso(iso_time)
+    dt = parse_iso(iso_time)
     if not dt:
         return None
     now = datetime.now(timezone.utc)
@@ -145,6 +163,20 @@ def _normalize_inference(inference):
     return normalized
 
 
+def normalize_audio_analysis(audio_analysis):
+    """
+    The audio_analysis form run_reasoning returns for valid input, or None
+    if run_reasoning would reject it.
+    """
+    ok, _ = _validate_audio_analysis(audio_analysis)
+    if not ok:
+        return None
+    return {
+        "transcription": audio_analysis.get("transcription", ""),
+        "inference": _normalize_inference(audio_analysis.get("inference")),
+    }
+
+
 def _validate_audio_analysis(payload):
     if not isinstance(payload, dict):
         return False, "audio_analysis must be an object"
@@ -285,23 +317,30 @@ def _call_gemini(prompt, user_input, api_key, api_endpoint, audio_bytes=None, au
         {"text": prompt},
         {"text": json.dumps(user_input, ensure_ascii=False)},
     ]
+    # The request body is assembled as bytes so the base64 audio is spliced
+    # in as-is instead of being decoded to str and re-scanned by json.dumps.
+    # Builds {"contents": [{"role": "user", "parts": [...]}]}.
+    body = [
+        b'{"contents":[{"role":"user","parts":',
+        json.dumps(parts, ensure_ascii=False)[:-1].encode("utf-8"),
+    ]
     if audio_bytes:
-        parts.append(
-            {
-                "inlineData": {
-                    "mimeType": audio_mime_type or "audio/wav",
-                    "data": base64.b64encode(audio_bytes).decode("ascii"),
-                }
-            }
-        )
+        body += [
+            b',{"inlineData":{"mimeType":',
+            json.dumps(audio_mime_type or "audio/wav").encode("utf-8"),
+            b',"data":"',
+            base64.b64encode(audio_bytes),
+            b'"}}',
+        ]
+    body.append(b"]}]}")
+    request_body = b"".join(body)
 
-    request_payload = {"contents": [{"role": "user", "parts": parts}]}
     start = time.perf_counter()
     model_name = "gemini-3"
     try:
         response = requests.post(
             api_endpoint,
-            json=request_payload,
+            data=request_body,
             headers=headers,
             timeout=30,
         )
@@ -416,10 +455,7 @@ def run_reasoning(
             "ai_meta": ai_meta,
         }
 
-    normalized_analysis = {
-        "transcription": audio_analysis.get("transcription", ""),
-        "inference": _normalize_inference(audio_analysis.get("inference")),
-    }
+    normalized_analysis = normalize_audio_analysis(audio_analysis)
     finalized_guidance = _finalize_guidance(
         ai_guidance,
         recent_summary,
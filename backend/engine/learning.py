@@ -1,6 +1,13 @@
 import json
 import os
-from datetime import datetime
+import threading
+from functools import lru_cache
+
+from engine.engine import parse_iso
+
+# Serializes read-modify-write updates of the memory file across request
+# threads.
+_MEMORY_LOCK = threading.Lock()
 
 DEFAULT_PRIORS = {
     "hunger": 0.25,
@@ -13,19 +20,46 @@ DEFAULT_PRIORS = {
 def _load_memory(memory_file):
     if not os.path.exists(memory_file):
         return {}
-    with open(memory_file, "r", encoding="utf-8") as f:
-        content = f.read().strip()
-        if not content:
-            return {}
-        try:
-            return json.loads(content)
-        except json.JSONDecodeError:
-            return {}
+    with open(memory_file, "rb") as f:
+        content = f.read()
+    if not content.strip():
+        return {}
+    try:
+        return json.loads(content)
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        return {}
+
+
+# Parsed memory for one stat key, replaced as a whole tuple. Shared by the
+# prior reads and the feedback writer, so nobody mutates the cached dict.
+_MEMORY_CACHE = {"entry": None}  # (memory_file, file_key, data)
+
+
+def _file_key(memory_file):
+    # _save_memory swaps in a new inode, so a saved update changes the key
+    # even within one mtime tick.
+    try:
+        st = os.stat(memory_file)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+def _read_memory(memory_file, file_key):
+    entry = _MEMORY_CACHE["entry"]
+    if file_key is not None and entry is not None and entry[:2] == (memory_file, file_key):
+        return entry[2]
+    data = _load_memory(memory_file)
+    _MEMORY_CACHE["entry"] = (memory_file, file_key, data)
+    return data
 
 
 def _save_memory(memory_file, data):
-    with open(memory_file, "w", encoding="utf-8") as f:
+    # Swap in a complete file so concurrent readers never see a partial one.
+    tmp_path = f"{memory_file}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
         json.dump(data, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, memory_file)
 
 
 def _normalize(priors):
@@ -39,19 +73,8 @@ def _normalize(priors):
     return normalized
 
 
-def _parse_iso(value):
-    if not value:
-        return None
-    try:
-        if isinstance(value, str) and value.endswith("Z"):
-            value = value[:-1] + "+00:00"
-        return datetime.fromisoformat(value)
-    except Exception:
-        return None
-
-
-def _time_bucket(occurred_at):
-    dt = _parse_iso(occurred_at)
+def time_bucket(occurred_at):
+    dt = parse_iso(occurred_at)
     if not dt:
         return "day"
     hour = dt.hour
@@ -69,8 +92,14 @@ def _merge_prior_values(source):
 
 
 def load_reasoning_priors(memory_file, occurred_at=None):
-    data = _load_memory(memory_file)
-    bucket = _time_bucket(occurred_at)
+    # Keyed on the file's stat. Callers get their own copy.
+    file_key = _file_key(memory_file)
+    return dict(_cached_priors(memory_file, file_key, time_bucket(occurred_at)))
+
+
+@lru_cache(maxsize=8)
+def _cached_priors(memory_file, file_key, bucket):
+    data = _read_memory(memory_file, file_key)
 
     bucket_priors = data.get("reasoning_priors_buckets")
     if isinstance(bucket_priors, dict):
@@ -105,11 +134,16 @@ def update_reasoning_priors(memory_file, event, feedback):
     if label not in DEFAULT_PRIORS:
         return None
 
-    data = _load_memory(memory_file)
-    bucket = _time_bucket(event.get("occurred_at"))
+    with _MEMORY_LOCK:
+        return _apply_prior_update(memory_file, event, label, helpful)
+
+
+def _apply_prior_update(memory_file, event, label, helpful):
+    # Copy the levels that change; the cached dict stays untouched.
+    data = dict(_read_memory(memory_file, _file_key(memory_file)))
+    bucket = time_bucket(event.get("occurred_at"))
     buckets = data.get("reasoning_priors_buckets")
-    if not isinstance(buckets, dict):
-        buckets = {}
+    buckets = dict(buckets) if isinstance(buckets, dict) else {}
     source_bucket = buckets.get(bucket)
     if not isinstance(source_bucket, dict):
         source_bucket = data.get("reasoning_priors")
@@ -126,6 +160,8 @@ def update_reasoning_priors(memory_file, event, feedback):
     # Keep a flat snapshot for backward compatibility with older readers.
     data["reasoning_priors"] = current
     _save_memory(memory_file, data)
+    # The next feedback or prior read reuses what was just written.
+    _MEMORY_CACHE["entry"] = (memory_file, _file_key(memory_file), data)
 
     return {
         "updated_label": label,